@@ -18,6 +18,7 @@ depth_limited_search(Node, _, 0, [Node]) :-
 
 depth_limited_search(Node, Visited, Depth, [Node | RestPath]) :-
     Depth > 0,
+    count_expansion,
     successor(Node, Next),
     \+ member(Next, Visited),
     format('Expanding: ~w, Depth remanining: ~w~n', [Next, Depth]),
@@ -84,17 +85,41 @@ valid_pos((X, Y), KeyPicked) :-
         KeyPicked = false, member(Cell, [' ', '*'])
     ).
 
-% Solve with iterative_deepening_ids
-solve_ids :-
+ids_start(estado((PX, PY), SortedBoxes, false)) :-
     board(Board),
     find_player(Board, PX, PY),
     findall((BX, BY),
             (nth0(BX, Board, Row), nth0(BY, Row, C), member(C, ['@', '$'])),
             Boxes),
-    sort(Boxes, SortedBoxes),  % normalizar
-    iterative_deepening(estado((PX, PY), SortedBoxes, false), Solution),
+    sort(Boxes, SortedBoxes).  % normalizar
+
+% Solve with iterative_deepening_ids
+solve_ids :-
+    ids_start(Start),
+    iterative_deepening(Start, Solution),
     print_solution(Solution).
 
+% Entry point of the Python engine pool (prolog_pool.py): the moves of the
+% solution, or none, and the number of nodes expanded
+solve_ids(Moves, Expanded) :-
+    nb_setval(expanded, 0),
+    ids_start(Start),
+    ( iterative_deepening(Start, Solution) -> states_moves(Solution, Moves) ; Moves = none ),
+    nb_getval(expanded, Expanded).
+
+% Moves between consecutive states of a solution
+states_moves([_], []).
+states_moves([estado((X, Y), _, _), estado((NX, NY), B, K) | Rest], [Move | Moves]) :-
+    DX is NX - X,
+    DY is NY - Y,
+    direction_name(DX, DY, Move),
+    states_moves([estado((NX, NY), B, K) | Rest], Moves).
+
+direction_name(-1, 0, up).
+direction_name(1, 0, down).
+direction_name(0, -1, left).
+direction_name(0, 1, right).
+
 print_solution([]).
 print_solution([estado((X,Y), Boxes, Key) | Rest]) :-
     format('Player: (~w,~w), Boxes: ~w, Key: ~w~n', [X, Y, Boxes, Key]),
@@ -180,6 +180,15 @@ replace_first_empty([Cell | Rest], [Cell | NewRest]) :-
     replace_first_empty(Rest, NewRest).
 
 
+% Expansion counter of the searches, only kept while the engine pool has it
+% set up with nb_setval(expanded, 0)
+count_expansion :-
+    (   nb_current(expanded, N)
+    ->  N1 is N + 1,
+        nb_setval(expanded, N1)
+    ;   true
+    ).
+
 check_win(_Board) :-
     game_over(true),
     !.
@@ -0,0 +1,62 @@
+import time
+from dataclasses import dataclass
+
+# Anytime view of the SA and GA engines. iter_simulated_annealing and
+# iter_genetic_algorithm are generators that yield a Snapshot every stride
+# evaluations (SA) or generations (GA) and a last one with done=True and the
+# usual SAResult/GAResult. Stopping early is just not asking for the next
+# snapshot; the generator keeps its whole state, so the run can be resumed
+# later by iterating it again.
+#
+#     run = iter_simulated_annealing(100, 0.001, 0.01, 10, data, stride=500)
+#     snapshot = run_for(run, max_time=1)      # one second of search
+#     ...
+#     snapshot = run_for(run, max_evaluations=snapshot.evaluations + 10000)
+
+@dataclass
+class Snapshot:
+    cost: float  # best cost so far (SA) or of the current population (GA)
+    solution: any  # the GameState (SA) or individual (GA) with that cost
+    evaluations: int
+    elapsed: float  # seconds spent inside the engine, pauses not counted
+    done: bool = False
+    result: any = None  # SAResult or GAResult once done
+
+# Seconds a generator spent running, not counting the time it was paused
+# between snapshots. The engines call pause() before each yield and resume()
+# after it.
+class ActiveTimer:
+    def __init__(self):
+        self.active = 0.0
+        self.resumed = time.perf_counter()
+
+    def elapsed(self):
+        return self.active + time.perf_counter() - self.resumed
+
+    def pause(self):
+        self.active = self.elapsed()
+        return self.active
+
+    def resume(self):
+        self.resumed = time.perf_counter()
+
+# Advances an anytime run until it is done or one of the budgets is reached
+# (elapsed seconds and evaluations, both counted from the start of the run)
+# and returns the last snapshot. The run can be passed in again to go on.
+def run_for(run, max_time=None, max_evaluations=None):
+    snapshot = None
+    for snapshot in run:
+        if snapshot.done:
+            break
+        if max_time is not None and snapshot.elapsed >= max_time:
+            break
+        if max_evaluations is not None and snapshot.evaluations >= max_evaluations:
+            break
+    return snapshot
+
+# Runs an anytime engine to the end and returns its result
+def finish(run):
+    snapshot = None
+    for snapshot in run:
+        pass
+    return snapshot.result
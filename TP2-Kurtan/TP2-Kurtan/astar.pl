@@ -120,6 +120,7 @@ astar_search([node(State, Path, _)|_], _, Path) :-
     goal_state(State), !.
 
 astar_search([node(State, Path, Cost)|Open], Closed, FinalPath) :-
+    count_expansion,
     findall(
         node(Succ, [Move|Path], NewCost),
         (successor(State, Succ, Move),
@@ -172,3 +173,11 @@ show_path :-
         print_moves(Path)
     ;   write('No path found.'), nl
     ).
+
+% Entry point of the Python engine pool (prolog_pool.py): the moves found, or
+% none, and the number of nodes expanded
+solve_astar(Moves, Expanded) :-
+    nb_setval(expanded, 0),
+    init_state(S),
+    ( astar(S, Path) -> Moves = Path ; Moves = none ),
+    nb_getval(expanded, Expanded).
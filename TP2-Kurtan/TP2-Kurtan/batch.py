@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+from multiprocessing.connection import wait
+
+from level import bundled_level, iter_levels
+
+# Solves a whole level collection with one engine, e.g.
+#
+#     python batch.py levels.txt --engine sa --time-limit 10 --output sa.jsonl
+#     python batch.py levels.txt --engine astar --workers 4 --output astar.csv
+#
+# Every level runs in its own worker process, at most `workers` at a time. A
+# level that goes over its wall-clock budget has its process terminated and is
+# reported as a timeout. Rows are written as soon as each level finishes, so
+# they come out in finishing order (the index column gives the file order).
+
+FIELDS = ['index', 'level', 'engine', 'status', 'solved', 'cost', 'moves', 'evaluations', 'time', 'error']
+
+DEFAULT_OPTIONS = {
+    'tmax': 100, 'tmin': 0.001, 'rate': 0.01, 'k': 10,
+    'generations': 100, 'pop_size': 30, 'cross_prob': 0.8, 'mut_prob': 0.2, 'genome_length': 40,
+    'backend': 'python', 'moves': 'step', 'heuristic': 'manhattan',
+    'schedule': 'exponential', 'canonical': False,
+}
+
+# Engine runners. Each one gets the level, the evaluation budget (None for no
+# limit) and the engine options, and returns (solved, cost, moves, evaluations)
+# or None when it cannot solve that level. moves is None for SA, which only
+# keeps the final state.
+def solve_sa(level, max_evaluations, options):
+    from simulated_annealing import simulated_annealing, is_optimum
+    data = {'state': level.initial_state()}
+    result = simulated_annealing(options['tmax'], options['tmin'], options['rate'], options['k'], data,
+                                 max_evaluations=max_evaluations, neighbourhood=options['moves'],
+                                 heuristic=options['heuristic'], schedule=options['schedule'])
+    return is_optimum(result.best_state), result.Cost, None, result.NumEvaluations
+
+def solve_ga(level, max_evaluations, options):
+    from genetic_algorithm import genetic_algorithm, genes_to_moves, is_optimum
+    state = level.initial_state()
+    data = {'N': options['genome_length'], 'optimum': 0, 'board': state.board, 'state': state,
+            'genes': options['moves'], 'heuristic': options['heuristic']}
+    result = genetic_algorithm(data, options['generations'], options['pop_size'], options['cross_prob'],
+                               options['mut_prob'], 'minimize', backend=options['backend'],
+                               max_evaluations=max_evaluations)
+    return is_optimum(result.Cost, data), result.Cost, genes_to_moves(result.u, data), result.NumEvaluations
+
+def search_heuristic(options):
+    if options['heuristic'] == 'assignment':
+        from heuristics import lower_bound
+        return lower_bound
+    from search import default_heuristic
+    return default_heuristic
+
+def solve_astar(level, max_evaluations, options):
+    from search import astar
+    result = astar(level.initial_state(), search_heuristic(options), max_expansions=max_evaluations,
+                   pushes=options['moves'] == 'push', canonical=options['canonical'])
+    return result.solved, result.cost, result.moves, result.expanded
+
+def solve_ids(level, max_evaluations, options):
+    from search import ida_star
+    result = ida_star(level.initial_state(), search_heuristic(options), max_expansions=max_evaluations)
+    return result.solved, result.cost, result.moves, result.expanded
+
+def solve_bidir(level, max_evaluations, options):
+    from search import bidirectional
+    result = bidirectional(level.initial_state(), max_expansions=max_evaluations)
+    return result.solved, result.cost, result.moves, result.expanded
+
+# astar.pl and IT.pl have the bundled board written into them, so the Prolog
+# engines are only run on that level and skip the others. Each level runs in
+# a new worker process, so the engine is started for that level; only
+# long-lived processes such as service.py workers keep it warm.
+def solve_prolog(program, level):
+    if level.board != bundled_level().board:
+        return None
+    from prolog_pool import default_pool
+    result = default_pool().solve(program)
+    if result is None:
+        raise RuntimeError("the Prolog engine stopped")
+    return result.solved, result.cost, result.moves, result.expanded
+
+def solve_astar_prolog(level, max_evaluations, options):
+    return solve_prolog('astar', level)
+
+def solve_ids_prolog(level, max_evaluations, options):
+    return solve_prolog('ids', level)
+
+ENGINES = {
+    'sa': solve_sa,
+    'ga': solve_ga,
+    'astar': solve_astar,
+    'ids': solve_ids,
+    'bidir': solve_bidir,
+    'astar-prolog': solve_astar_prolog,
+    'ids-prolog': solve_ids_prolog,
+}
+
+# Engines whose result depends on the seed
+STOCHASTIC_ENGINES = {'sa', 'ga'}
+
+# Solves one level and returns its result row. The engine's own output is
+# discarded.
+def solve_level(engine, index, level, max_evaluations, options, seed):
+    start = time.perf_counter()
+    row = {'index': index, 'level': level.name, 'engine': engine}
+    try:
+        if seed is not None:
+            random.seed(seed + index)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            outcome = ENGINES[engine](level, max_evaluations, options)
+        if outcome is None:
+            row['status'] = 'skipped'
+        else:
+            solved, cost, moves, evaluations = outcome
+            row.update(status='solved' if solved else 'unsolved', solved=bool(solved), cost=cost,
+                       moves=moves, evaluations=evaluations)
+    except Exception as e:
+        row.update(status='error', solved=False, error=repr(e))
+    row['time'] = time.perf_counter() - start
+    return row
+
+# Runs in the worker process and sends one result row back through conn
+def _run_level(conn, engine, index, level, max_evaluations, options, seed):
+    conn.send(solve_level(engine, index, level, max_evaluations, options, seed))
+    conn.close()
+
+# Yields one result row per level as the levels finish. time_limit is the
+# wall-clock budget per level in seconds and max_evaluations the evaluation
+# budget (SA and GA evaluations, A* and IDA* expansions); None means no limit.
+def solve_levels(levels, engine='sa', workers=None, time_limit=None, max_evaluations=None, options=None,
+                 seed=None):
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    workers = workers or os.cpu_count() or 1
+    levels = enumerate(levels)
+    running = {}  # receiving end of the pipe -> (process, index, name, deadline)
+
+    try:
+        while True:
+            while len(running) < workers:
+                item = next(levels, None)
+                if item is None:
+                    break
+                index, level = item
+                recv, send = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_run_level, args=(send, engine, index, level, max_evaluations, options, seed)
+                )
+                process.start()
+                send.close()
+                deadline = time.monotonic() + time_limit if time_limit else None
+                running[recv] = (process, index, level.name, deadline)
+            if not running:
+                return
+
+            deadlines = [deadline for *_, deadline in running.values() if deadline is not None]
+            timeout = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            for conn in wait(list(running), timeout):
+                process, index, name, _ = running.pop(conn)
+                try:
+                    row = conn.recv()
+                except EOFError:  # the worker died without sending a result
+                    row = None
+                conn.close()
+                process.join()
+                yield row or {'index': index, 'level': name, 'engine': engine, 'status': 'error', 'solved': False,
+                              'error': f"worker exited with code {process.exitcode}"}
+
+            now = time.monotonic()
+            for conn, (process, index, name, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    process.terminate()
+                    process.join()
+                    conn.close()
+                    del running[conn]
+                    yield {'index': index, 'level': name, 'engine': engine, 'status': 'timeout', 'solved': False,
+                           'time': time_limit}
+    finally:
+        for process, *_ in running.values():
+            process.terminate()
+            process.join()
+
+# Writes each row as soon as it arrives, as JSON lines or CSV, and returns the
+# number of levels per status
+def write_results(rows, out, fmt='jsonl'):
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, FIELDS)
+        writer.writeheader()
+    counts = Counter()
+    for row in rows:
+        if fmt == 'csv':
+            moves = row.get('moves')
+            writer.writerow({**row, 'moves': ' '.join(moves) if moves else ''})
+        else:
+            out.write(json.dumps(row) + '\n')
+        out.flush()
+        counts[row['status']] += 1
+    return counts
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Solve every level of a collection")
+    parser.add_argument('path', help="level collection file")
+    parser.add_argument('--engine', choices=list(ENGINES), default='sa')
+    parser.add_argument('--workers', type=int, help="levels solved at the same time (default: CPU count)")
+    parser.add_argument('--time-limit', type=float, help="seconds per level before its worker is killed")
+    parser.add_argument('--max-evaluations', type=int, help="evaluations (or expansions) per level")
+    parser.add_argument('--output', help="results file (default: stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="default: from the output file extension")
+    parser.add_argument('--seed', type=int, help="level i is solved with seed + i")
+    parser.add_argument('--level-format', choices=['sokoban', 'kurtan'], help="default: guessed per level")
+    parser.add_argument('--generations', type=int, default=DEFAULT_OPTIONS['generations'])
+    parser.add_argument('--pop-size', type=int, default=DEFAULT_OPTIONS['pop_size'])
+    parser.add_argument('--genome-length', type=int, default=DEFAULT_OPTIONS['genome_length'])
+    parser.add_argument('--backend', choices=['python', 'numpy'], default=DEFAULT_OPTIONS['backend'])
+    parser.add_argument('--moves', choices=['step', 'push'], default=DEFAULT_OPTIONS['moves'],
+                        help="SA/GA/A* work in single steps or in pushes (not IDA*)")
+    parser.add_argument('--schedule', choices=['exponential', 'adaptive', 'lundy-mees'],
+                        default=DEFAULT_OPTIONS['schedule'], help="SA cooling schedule")
+    parser.add_argument('--heuristic', choices=['manhattan', 'assignment'], default=DEFAULT_OPTIONS['heuristic'],
+                        help="box term of every engine: Manhattan distance or the push-distance assignment bound")
+    parser.add_argument('--canonical', action='store_true',
+                        help="A* with --moves push merges states whose player is in the same region")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    fmt = args.format or ('csv' if args.output and args.output.endswith('.csv') else 'jsonl')
+    options = {'generations': args.generations, 'pop_size': args.pop_size,
+               'genome_length': args.genome_length, 'backend': args.backend, 'moves': args.moves,
+               'heuristic': args.heuristic, 'schedule': args.schedule, 'canonical': args.canonical}
+    rows = solve_levels(iter_levels(args.path, args.level_format), args.engine, args.workers, args.time_limit,
+                        args.max_evaluations, options, args.seed)
+
+    with (open(args.output, 'w', newline='') if args.output else contextlib.nullcontext(sys.stdout)) as out:
+        counts = write_results(rows, out, fmt)
+    print(', '.join(f"{status}: {n}" for status, n in sorted(counts.items())), file=sys.stderr)
+    return counts
+
+if __name__ == "__main__":
+    main()
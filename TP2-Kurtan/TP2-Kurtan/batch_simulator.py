@@ -0,0 +1,202 @@
+import random
+
+import numpy as np
+
+from tabuleiro import AXES, DIRECTIONS, DIRECTION_INDEX
+
+# Vectorised version of genetic_algorithm.eval_func. The whole population is
+# stepped in lockstep: every array has one row per individual, and each rule of
+# GameState.move, is_box_stuck and apply_pull becomes a boolean mask over the
+# rows it applies to.
+#
+# Cells use the same row-major indices as tabuleiro.Layout, plus one extra
+# sentinel cell (index C) that stands for "out of bounds" and behaves as a wall.
+class BatchSimulator:
+    def __init__(self, data):
+        from genetic_algorithm import get_initial_state
+        state = get_initial_state(data)
+        layout = state.layout
+        C = layout.rows * layout.cols
+        self.initial = state
+        self.C = C
+
+        self.walls = np.zeros(C + 1, dtype=bool)
+        self.walls[[i for i in range(C) if layout.walls >> i & 1]] = True
+        self.walls[C] = True
+        self.targets = np.zeros(C + 1, dtype=bool)
+        self.targets[list(layout.target_cells)] = True
+        self.target_cells = np.array(layout.target_cells, dtype=np.int64)
+        self.gate = layout.gate
+        self.open_cells = np.array(layout.open_cells, dtype=np.int64)
+
+        self.neighbours = np.full((4, C + 1), C, dtype=np.int64)
+        for d in range(4):
+            for i, n in enumerate(layout.neighbours[d]):
+                if n >= 0:
+                    self.neighbours[d, i] = n
+        self.opposite = np.array([1, 0, 3, 2])
+
+        self.target_distance = np.array(layout.target_distance + (0,), dtype=np.int64)
+        self.dead = np.zeros(C + 1, dtype=bool)
+        self.dead[[i for i in range(C) if layout.dead >> i & 1]] = True
+        self.axis_blocked = np.zeros((2, C + 1), dtype=bool)
+        for axis in range(2):
+            self.axis_blocked[axis, [i for i in range(C) if layout.axis_blocked[axis] >> i & 1]] = True
+        cells = np.arange(C + 1)
+        self.row, self.col = cells // layout.cols, cells % layout.cols
+
+    def evaluate(self, population):
+        if not population:
+            return []
+        return self.simulate(population).tolist()
+
+    def encode(self, population):
+        length = max(len(individual) for individual in population)
+        moves = np.full((len(population), length), -1, dtype=np.int64)
+        for r, individual in enumerate(population):
+            moves[r, :len(individual)] = [DIRECTION_INDEX[m] for m in individual]
+        return moves
+
+    def initial_arrays(self, N):
+        s = self.initial
+        boxes = np.zeros((N, self.C + 1), dtype=bool)
+        boxes[:, [i for i in range(self.C) if s.boxes >> i & 1]] = True
+        return {
+            'player': np.full(N, s.player, dtype=np.int64),
+            'boxes': boxes,
+            'key': np.full(N, s.key, dtype=np.int64),
+            'key_picked': np.full(N, s.key_picked),
+            'key_visible': np.full(N, s.key_visible),
+            'game_over': np.full(N, s.game_over),
+            'real_moves': np.zeros(N, dtype=np.int64),
+            'solved': np.full(N, s.is_goal_state()),
+        }
+
+    # Runs all moves and returns the arrays describing the final states
+    def run(self, population):
+        moves = self.encode(population)
+        N = len(population)
+        a = self.initial_arrays(N)
+        rows = np.arange(N)
+        player, boxes, key = a['player'], a['boxes'], a['key']
+        key_picked, key_visible, game_over = a['key_picked'], a['key_visible'], a['game_over']
+        walls, nb = self.walls, self.neighbours
+
+        for t in range(moves.shape[1]):
+            d = moves[:, t]
+            dd = np.maximum(d, 0)
+            valid = ~a['solved'] & (d >= 0) & ~game_over
+
+            # GameState.move
+            n = nb[dd, player]
+            is_box = boxes[rows, n]
+            dest = nb[dd, n]
+            can_push = ~walls[dest] & ~boxes[rows, dest] & (dest != self.gate) & (dest != key)
+            is_gate = n == self.gate
+            is_key = n == key
+            placed = boxes[:, self.target_cells].all(axis=1)
+            free = ~walls[n] & np.where(is_gate, key_picked & placed, True) & np.where(is_key, key_visible, True)
+            success = valid & (n != self.C) & np.where(is_box, can_push, free)
+
+            push = success & is_box
+            boxes[rows[push], n[push]] = False
+            boxes[rows[push], dest[push]] = True
+            player[success] = n[success]
+            game_over |= success & is_gate
+            picked = success & is_key & ~is_box
+            key_picked |= picked
+            key[picked] = -1
+
+            appear = success & ~key_visible & boxes[:, self.target_cells].all(axis=1)
+            key_visible |= appear
+            self.place_key(appear, player, boxes, key)
+            a['real_moves'] += success
+
+            # kurtan_utils.is_box_stuck, then apply_pull when it says so
+            stuck = success & self.is_box_stuck(rows, dd, player, boxes)
+            self.apply_pull(stuck, rows, dd, player, boxes, key)
+
+            finished = key_picked & game_over if self.gate >= 0 else True
+            a['solved'] |= boxes[:, self.target_cells].all(axis=1) & finished
+        return a
+
+    def simulate(self, population):
+        a = self.run(population)
+        boxes = a['boxes'][:, :self.C]
+        distance = boxes.astype(np.int64) @ self.target_distance[:self.C]
+        cells = np.arange(self.C)
+        stuck = self.is_stuck(a['boxes'], np.arange(len(population))[:, None], cells[None, :]).sum(axis=1)
+
+        target = np.where(a['key_picked'], self.gate, np.maximum(a['key'], 0))
+        to_target = np.abs(self.row[a['player']] - self.row[target]) + np.abs(self.col[a['player']] - self.col[target])
+
+        fitness = a['real_moves'] + np.where(a['key_visible'], to_target, distance + 20 * stuck)
+        return np.where(a['solved'], 0, fitness)
+
+    # GameState.is_stuck for the box cells b of the given rows (any shapes that
+    # broadcast together)
+    def is_stuck(self, boxes, rows, b):
+        frozen = [self.is_frozen_on_axis(boxes, rows, b, axis) for axis in range(2)]
+        return boxes[rows, b] & ~self.targets[b] & (self.dead[b] | (frozen[0] & frozen[1]))
+
+    def is_frozen_on_axis(self, boxes, rows, b, axis):
+        frozen = self.axis_blocked[axis, b]
+        for d in AXES[axis]:
+            n = self.neighbours[d, b]
+            frozen = frozen | (boxes[rows, n] & self.axis_blocked[1 - axis, n])
+        return frozen
+
+    def place_key(self, mask, player, boxes, key):
+        if not mask.any():
+            return
+        idx = np.nonzero(mask)[0]
+        free = ~boxes[idx][:, self.open_cells] & (self.open_cells[None, :] != player[idx, None])
+        found = free.any(axis=1)
+        key[idx[found]] = self.open_cells[free[found].argmax(axis=1)]
+
+    def is_box_stuck(self, rows, d, player, boxes):
+        return self.is_stuck(boxes, rows, self.neighbours[d, player])
+
+    def apply_pull(self, mask, rows, d, player, boxes, key):
+        nb, C = self.neighbours, self.C
+        b = nb[d, player]
+        behind = nb[d, b]
+        back = nb[self.opposite[d], player]
+
+        plain_box = (b != C) & boxes[rows, b] & ~self.targets[b]
+        behind_blocked = (behind != C) & (
+            self.walls[behind] | (behind == self.gate) | (boxes[rows, behind] & ~self.targets[behind]) | (behind == key)
+        )
+        back_free = ~self.walls[back] & ~boxes[rows, back] & (back != self.gate) & (back != key)
+        pull = mask & plain_box & behind_blocked & back_free
+
+        boxes[rows[pull], b[pull]] = False
+        boxes[rows[pull], player[pull]] = True
+        player[pull] = back[pull]
+
+# Replays random move sequences with GameState.move and with the batch
+# simulator and checks that the final states and fitness values agree
+def check_against_reference(data, population_size=200, genome_length=40, seed=0):
+    from genetic_algorithm import eval_func
+    from kurtan_utils import apply_pull, is_box_stuck
+
+    rng = random.Random(seed)
+    population = [[rng.choice(DIRECTIONS) for _ in range(genome_length)] for _ in range(population_size)]
+    simulator = BatchSimulator(data)
+    a = simulator.run(population)
+    fitness = simulator.simulate(population)
+
+    for r, individual in enumerate(population):
+        state = simulator.initial.clone()
+        for move in individual:
+            if state.is_goal_state():
+                break
+            if state.move(move)[0] and is_box_stuck(state, move):
+                state = apply_pull(state, move) or state
+        assert state.player == a['player'][r], (individual, 'player')
+        assert state.boxes == sum(1 << int(i) for i in np.nonzero(a['boxes'][r, :simulator.C])[0]), (individual, 'boxes')
+        assert (state.key, state.key_picked, state.key_visible, state.game_over) == (
+            a['key'][r], a['key_picked'][r], a['key_visible'][r], a['game_over'][r]
+        ), (individual, 'key')
+        assert fitness[r] == eval_func(individual, data), (individual, 'fitness')
+    return True
@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from level import iter_levels
+from tabuleiro import DIRECTIONS
+
+# Fixed-seed benchmarks for the game model and the metaheuristics, e.g.
+#
+#     python benchmark.py --save benchmark_baseline.json
+#     python benchmark.py --compare benchmark_baseline.json --threshold 0.15
+#
+# Micro-benchmarks time GameState.move, clone, kurtan_utils.is_box_stuck and
+# both eval_func on the bundled level. Macro-benchmarks run SA and GA on the
+# reference levels with several seeds and record the fraction solved, the
+# evaluations used and the wall time.
+#
+# Every timing is repeated: the results hold the median of the repeats, and
+# 'noise' holds half the spread of the repeats relative to that median. A
+# comparison flags every metric that got worse than the baseline by more than
+# the threshold plus the larger noise of the two runs, so a noisy machine
+# widens the band instead of reporting regressions at random. The fraction
+# solved and the evaluations are fixed by the seeds and have no noise.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_LEVELS = os.path.join(HERE, 'levels.txt')
+BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+
+MACRO_SEEDS = range(5)
+MACRO_BUDGET = 20000  # evaluations per run
+REPEATS = 5  # runs of every timing
+# Wall times closer than this are not flagged, whatever the relative change
+MIN_TIME_DELTA = 0.01
+
+# Calls step(i) for i in range(n) repeat times and returns the calls per
+# second of every repeat
+def rates(step, n, repeat=REPEATS):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(n):
+            step(i)
+        samples.append(n / (time.perf_counter() - start))
+    return samples
+
+# Median of the samples and half their spread relative to it
+def summarise(samples):
+    median = statistics.median(samples)
+    return median, (max(samples) - min(samples)) / (2 * median) if median else 0.0
+
+# States met on a random walk from the start, used as inputs to the
+# micro-benchmarks so they cover pushes, the key and the gate
+def sample_states(initial, count, rng):
+    states = []
+    state = initial.clone()
+    while len(states) < count:
+        if state.is_goal_state() or rng.random() < 0.02:
+            state = initial.clone()
+        state.move(rng.choice(DIRECTIONS))
+        states.append(state.clone())
+    return states
+
+# Returns {metric: [calls per second of every repeat]}
+def micro_benchmarks(level, n=20000, seed=0, repeat=REPEATS):
+    import genetic_algorithm
+    import simulated_annealing
+    from kurtan_utils import is_box_stuck
+
+    rng = random.Random(seed)
+    initial = level.initial_state()
+    states = sample_states(initial, n, rng)
+    moves = [rng.choice(DIRECTIONS) for _ in range(n)]
+    individuals = [[rng.choice(DIRECTIONS) for _ in range(40)] for _ in range(n // 40)]
+    data = {'N': 40, 'optimum': 0, 'board': initial.board, 'state': initial}
+
+    walker = [initial.clone()]
+    def move(i):
+        if i % 50 == 0:
+            walker[0] = initial.clone()
+        walker[0].move(moves[i])
+
+    return {
+        'moves_per_sec': rates(move, n, repeat),
+        'clones_per_sec': rates(lambda i: states[i].clone(), n, repeat),
+        'stuck_checks_per_sec': rates(lambda i: is_box_stuck(states[i], moves[i]), n, repeat),
+        'sa_evals_per_sec': rates(lambda i: simulated_annealing.eval_func(states[i]), n, repeat),
+        'ga_evals_per_sec': rates(lambda i: genetic_algorithm.eval_func(individuals[i], data), len(individuals), repeat),
+    }
+
+def run_sa(level, seed):
+    from simulated_annealing import simulated_annealing, is_optimum
+    random.seed(seed)
+    result = simulated_annealing(100, 0.001, 0.01, 10, {'state': level.initial_state()},
+                                 max_evaluations=MACRO_BUDGET)
+    return is_optimum(result.best_state), result.NumEvaluations
+
+def run_ga(level, seed):
+    from genetic_algorithm import genetic_algorithm, is_optimum
+    random.seed(seed)
+    state = level.initial_state()
+    data = {'N': 40, 'optimum': 0, 'board': state.board, 'state': state}
+    result = genetic_algorithm(data, 1000, 30, 0.8, 0.2, 'minimize', max_evaluations=MACRO_BUDGET)
+    return is_optimum(result.Cost, data), result.NumEvaluations
+
+# Mean fraction solved, evaluations and seconds per run over MACRO_SEEDS.
+# Unsolved runs count with the evaluations and time they used. The seeds fix
+# the runs, so only the time changes between repeats: it is a list with the
+# mean of every repeat.
+def macro_benchmarks(levels, seeds=MACRO_SEEDS, repeat=REPEATS):
+    report = {}
+    for engine, run in [('sa', run_sa), ('ga', run_ga)]:
+        for level in levels:
+            solved, evaluations, times = [], [], []
+            for _ in range(repeat):
+                seconds = []
+                for seed in seeds:
+                    start = time.perf_counter()
+                    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                        ok, used = run(level, seed)
+                    seconds.append(time.perf_counter() - start)
+                    solved.append(ok)
+                    evaluations.append(used)
+                times.append(statistics.mean(seconds))
+            report[f"{engine}/{level.name}"] = {
+                'solved': sum(solved) / len(solved),
+                'evaluations': statistics.mean(evaluations),
+                'time': times,
+            }
+    return report
+
+# Medians of the repeated timings, plus their noise under 'noise'
+def run_benchmarks(path=REFERENCE_LEVELS, macro=True, repeat=REPEATS):
+    levels = list(iter_levels(path))
+    results = {'micro': micro_benchmarks(levels[0], repeat=repeat)}
+    if macro:
+        results['macro'] = macro_benchmarks(levels, repeat=repeat)
+    noise = {}
+    for metric, samples in flatten(results).items():
+        if isinstance(samples, list):
+            median, noise[metric] = summarise(samples)
+            section, name = metric.split('.', 1)
+            if section == 'micro':
+                results['micro'][name] = median
+            else:
+                run, name = name.rsplit('.', 1)
+                results['macro'][run][name] = median
+    results['noise'] = noise
+    return results
+
+# {'micro.moves_per_sec': ..., 'macro.sa/bundled.time': ...}
+def flatten(results):
+    flat = {f"micro.{name}": value for name, value in results.get('micro', {}).items()}
+    for run, metrics in results.get('macro', {}).items():
+        for name, value in metrics.items():
+            flat[f"macro.{run}.{name}"] = value
+    return flat
+
+def higher_is_better(metric):
+    return metric.endswith('_per_sec') or metric.endswith('.solved')
+
+# Relative change of every metric in both runs, signed so that a positive
+# value is an improvement, and the band it has to leave to count: the
+# threshold plus the larger noise of the two runs (a baseline without noise
+# counts as noiseless). Returns [(metric, baseline, current, change, band, regressed)].
+def compare(baseline, current, threshold=0.1):
+    old, new = flatten(baseline), flatten(current)
+    old_noise, new_noise = baseline.get('noise', {}), current.get('noise', {})
+    report = []
+    for metric in sorted(old.keys() & new.keys()):
+        a, b = old[metric], new[metric]
+        if a == 0:
+            change = 0.0 if b == 0 else (1.0 if higher_is_better(metric) else -1.0)
+        else:
+            change = (b - a) / a if higher_is_better(metric) else (a - b) / a
+        band = threshold + max(old_noise.get(metric, 0.0), new_noise.get(metric, 0.0))
+        regressed = change < -band and not (metric.endswith('.time') and b - a < MIN_TIME_DELTA)
+        report.append((metric, a, b, change, band, regressed))
+    return report
+
+def print_comparison(report, threshold):
+    width = max(len(metric) for metric, *_ in report)
+    for metric, a, b, change, band, regressed in report:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{metric:<{width}}  {a:>12.4g}  {b:>12.4g}  {change:+8.1%}  (band {band:.0%}){flag}")
+    regressions = sum(regressed for *_, regressed in report)
+    print(f"{regressions} regression(s) beyond {threshold:.0%} plus noise")
+
+def print_results(results):
+    noise = results.get('noise', {})
+    for metric, value in flatten(results).items():
+        spread = f"  +/- {noise[metric]:.1%}" if metric in noise else ''
+        print(f"{metric:<40}  {value:>12.4g}{spread}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kurtan benchmarks")
+    parser.add_argument('--levels', default=REFERENCE_LEVELS, help="reference level collection")
+    parser.add_argument('--micro-only', action='store_true', help="skip the SA/GA runs")
+    parser.add_argument('--save', nargs='?', const=BASELINE, help="store the results as a baseline")
+    parser.add_argument('--compare', nargs='?', const=BASELINE, help="compare against a stored baseline")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative change counted as a regression, on top of the measured noise")
+    parser.add_argument('--repeat', type=int, default=REPEATS, help="runs of every timing")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.levels, macro=not args.micro_only, repeat=args.repeat)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        report = compare(baseline, results, args.threshold)
+        print_comparison(report, args.threshold)
+        if any(regressed for *_, regressed in report):
+            sys.exit(1)
+    return results
+
+if __name__ == "__main__":
+    main()
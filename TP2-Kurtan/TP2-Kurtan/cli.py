@@ -0,0 +1,289 @@
+import argparse
+import contextlib
+import json
+import random
+import sys
+import time
+
+# Non-interactive entry point for batch runs, e.g.
+#
+#     python cli.py sa --seed 1 --format json
+#     python cli.py ga --generations 200 --workers 4 --plot ga.png
+#     python cli.py astar --level my_level.txt
+#
+# Each subcommand only imports the modules its engine needs. Solver progress
+# goes to stderr and the result to stdout, as text or JSON.
+
+def initial_state(args):
+    from level import bundled_level, load_level
+    if args.level:
+        return load_level(args.level, args.level_index, args.level_format).initial_state()
+    return bundled_level().initial_state()
+
+def profiler(args):
+    from metrics import SamplingProfiler
+    return SamplingProfiler() if args.profile else None
+
+# --trace sends the tracing.py events of the run to stderr, or to a JSON lines
+# file with --trace-file
+def configure_tracing(args):
+    import tracing
+    if args.trace == 'off':
+        return
+    sink = tracing.JsonlSink(args.trace_file) if args.trace_file else tracing.StdoutSink(sys.stderr)
+    tracing.configure(tracing.LEVELS[args.trace], sink)
+
+def save_metrics(args, result):
+    if args.metrics:
+        result.metrics.to_json(args.metrics)
+
+# A* and IDA* heuristic for --heuristic
+def search_heuristic(args):
+    if args.heuristic == 'assignment':
+        from heuristics import lower_bound
+        return lower_bound
+    from search import default_heuristic
+    return default_heuristic
+
+def run_sa(args):
+    from simulated_annealing import simulated_annealing, is_optimum
+    data = {'state': initial_state(args)}
+    result = simulated_annealing(args.tmax, args.tmin, args.rate, args.k, data, plot=args.plot,
+                                 max_evaluations=args.max_evaluations, profiler=profiler(args),
+                                 neighbourhood=args.moves, heuristic=args.heuristic, schedule=args.schedule,
+                                 stagnation=args.stagnation, reheat=args.reheat, max_reheats=args.max_reheats,
+                                 restart=args.restart, max_time=args.max_time, timed=bool(args.metrics))
+    save_metrics(args, result)
+    return {
+        'solved': is_optimum(result.best_state),
+        'cost': result.Cost,
+        'evaluations': result.NumEvaluations,
+        'reheats': result.reheats,
+        'stop': result.stop,
+        'board': [''.join(row) for row in result.best_state.board],
+    }
+
+def run_pt(args):
+    from parallel_tempering import parallel_tempering
+    from simulated_annealing import is_optimum
+    data = {'state': initial_state(args)}
+    result = parallel_tempering(data, args.replicas, args.tmin, args.tmax, args.steps, args.rounds,
+                                args.max_evaluations, args.seed, profiler(args), args.share_interval)
+    save_metrics(args, result)
+    return {
+        'solved': is_optimum(result.best_state),
+        'cost': result.Cost,
+        'evaluations': result.NumEvaluations,
+        'rounds': result.rounds,
+        'swaps': f"{result.swaps_accepted}/{result.swaps_attempted}",
+        'shares': result.shares,
+        'board': [''.join(row) for row in result.best_state.board],
+    }
+
+def run_ga(args):
+    from genetic_algorithm import genetic_algorithm, genes_to_moves, is_optimum
+    state = initial_state(args)
+    data = {'N': args.genome_length, 'optimum': args.optimum, 'board': state.board, 'state': state,
+            'genes': args.moves, 'heuristic': args.heuristic}
+    result = genetic_algorithm(data, args.generations, args.pop_size, args.cross_prob, args.mut_prob,
+                               'minimize', workers=args.workers, backend=args.backend, plot=args.plot,
+                               max_evaluations=args.max_evaluations, profiler=profiler(args))
+    save_metrics(args, result)
+    return {
+        'solved': is_optimum(result.Cost, data),
+        'cost': result.Cost,
+        'evaluations': result.NumEvaluations,
+        'moves': genes_to_moves(result.u, data),
+    }
+
+def run_islands(args):
+    from genetic_algorithm import genes_to_moves, is_optimum
+    from island_ga import island_genetic_algorithm
+    state = initial_state(args)
+    data = {'N': args.genome_length, 'optimum': args.optimum, 'board': state.board, 'state': state,
+            'genes': args.moves, 'heuristic': args.heuristic}
+    topology = json.loads(args.topology) if args.topology.startswith('[') else args.topology
+    result = island_genetic_algorithm(data, args.generations, args.pop_size, args.cross_prob, args.mut_prob,
+                                      'minimize', args.islands, topology, args.interval, args.migrants,
+                                      args.max_evaluations, args.seed, args.plot, profiler(args))
+    save_metrics(args, result)
+    return {
+        'solved': is_optimum(result.Cost, data),
+        'cost': result.Cost,
+        'evaluations': result.NumEvaluations,
+        'islands': [trace.Fit[-1] for trace in result.islands],
+        'moves': genes_to_moves(result.u, data),
+    }
+
+def search_result(result):
+    return {
+        'solved': result.solved,
+        'cost': result.cost,
+        'moves': result.moves,
+        'expanded': result.expanded,
+        'generated': result.generated,
+        'iterations': result.iterations,
+    }
+
+def prolog_result(result):
+    if result is None:
+        return {'solved': False}
+    return {'solved': result.solved, 'cost': result.cost, 'moves': result.moves, 'expanded': result.expanded,
+            'time': result.time}
+
+def run_astar(args):
+    if args.prolog:
+        from menu import run_astar_prolog
+        return prolog_result(run_astar_prolog())
+    from search import astar
+    return search_result(astar(initial_state(args), search_heuristic(args), max_expansions=args.max_expansions,
+                               pushes=args.moves == 'push', canonical=args.canonical))
+
+def run_ids(args):
+    if args.prolog:
+        from menu import run_iterative_deepening_prolog
+        return prolog_result(run_iterative_deepening_prolog())
+    from search import ida_star
+    return search_result(ida_star(initial_state(args), search_heuristic(args), max_bound=args.max_bound,
+                                  max_expansions=args.max_expansions))
+
+def run_bidir(args):
+    from search import bidirectional
+    return search_result(bidirectional(initial_state(args), max_expansions=args.max_expansions))
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Kurtan solvers")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--seed', type=int, help="random seed")
+    common.add_argument('--level', help="level collection file (Sokoban or tabuleiro characters)")
+    common.add_argument('--level-index', type=int, default=0, help="which level of the file to solve")
+    common.add_argument('--level-format', choices=['sokoban', 'kurtan'], help="default: guessed per level")
+    common.add_argument('--format', choices=['text', 'json'], default='text', help="output format")
+    common.add_argument('--trace', choices=['off', 'info', 'debug'], default='off',
+                        help="solver events: one per temperature, generation or iteration (info), or every move")
+    common.add_argument('--trace-file', help="write the trace events to this JSON lines file instead of stderr")
+    heuristic = argparse.ArgumentParser(add_help=False)
+    heuristic.add_argument('--heuristic', choices=['manhattan', 'assignment'], default='manhattan',
+                           help="score boxes by Manhattan distance or by the push-distance assignment bound")
+    sub = parser.add_subparsers(dest='engine', required=True)
+
+    sa = sub.add_parser('sa', parents=[common, heuristic], help="simulated annealing")
+    sa.add_argument('--tmax', type=float, default=100)
+    sa.add_argument('--tmin', type=float, default=0.001)
+    sa.add_argument('--rate', type=float, default=0.01, help="cooling rate R")
+    sa.add_argument('--k', type=int, default=10, help="iterations per temperature")
+    sa.add_argument('--schedule', choices=['exponential', 'adaptive', 'lundy-mees'], default='exponential',
+                    help="cooling schedule")
+    sa.add_argument('--stagnation', type=int, help="reheat after this many temperatures without a new best")
+    sa.add_argument('--reheat', type=float, default=0.5, help="reheat temperature as a fraction of --tmax")
+    sa.add_argument('--max-reheats', type=int, default=3)
+    sa.add_argument('--restart', action='store_true', help="go back to the best state when reheating")
+    sa.add_argument('--max-evaluations', type=int)
+    sa.add_argument('--max-time', type=float, help="seconds of wall time")
+    sa.add_argument('--moves', choices=['step', 'push'], default='step', help="neighbours by single steps or pushes")
+    sa.add_argument('--plot', help="save the cost plot to this file")
+    sa.add_argument('--metrics', help="save the run metrics to this JSON file")
+    sa.add_argument('--profile', action='store_true', help="sample the Python stack during the run (Unix)")
+    sa.set_defaults(run=run_sa)
+
+    pt = sub.add_parser('pt', parents=[common], help="parallel tempering (SA replicas in worker processes)")
+    pt.add_argument('--replicas', type=int, help="default: CPU count")
+    pt.add_argument('--tmin', type=float, default=0.1)
+    pt.add_argument('--tmax', type=float, default=20)
+    pt.add_argument('--steps', type=int, default=100, help="Metropolis steps per replica between swaps")
+    pt.add_argument('--rounds', type=int, default=1000)
+    pt.add_argument('--max-evaluations', type=int)
+    pt.add_argument('--share-interval', type=int, default=10,
+                    help="restart the coldest replica from the global best every this many rounds (0: never)")
+    pt.add_argument('--metrics', help="save the run metrics to this JSON file")
+    pt.add_argument('--profile', action='store_true', help="sample the Python stack during the run (Unix)")
+    pt.set_defaults(run=run_pt)
+
+    ga = sub.add_parser('ga', parents=[common, heuristic], help="genetic algorithm")
+    ga.add_argument('--generations', type=int, default=100)
+    ga.add_argument('--pop-size', type=int, default=30)
+    ga.add_argument('--cross-prob', type=float, default=0.8)
+    ga.add_argument('--mut-prob', type=float, default=0.2)
+    ga.add_argument('--genome-length', type=int, default=10)
+    ga.add_argument('--optimum', type=float, default=0)
+    ga.add_argument('--workers', type=int, default=1)
+    ga.add_argument('--backend', choices=['python', 'numpy'], default='python')
+    ga.add_argument('--moves', choices=['step', 'push'], default='step', help="genes are single steps or pushes")
+    ga.add_argument('--max-evaluations', type=int)
+    ga.add_argument('--plot', help="save the fitness plots to this file")
+    ga.add_argument('--metrics', help="save the run metrics to this JSON file")
+    ga.add_argument('--profile', action='store_true', help="sample the Python stack during the run (Unix)")
+    ga.set_defaults(run=run_ga)
+
+    islands = sub.add_parser('islands', parents=[common, heuristic], help="island model GA (one process per island)")
+    islands.add_argument('--islands', type=int, help="default: CPU count")
+    islands.add_argument('--topology', default='ring',
+                         help="ring, complete, random or a JSON list of destination islands per island")
+    islands.add_argument('--interval', type=int, default=10, help="generations between migrations")
+    islands.add_argument('--migrants', type=int, default=2, help="elites each island sends per migration")
+    islands.add_argument('--generations', type=int, default=100)
+    islands.add_argument('--pop-size', type=int, default=30, help="individuals per island")
+    islands.add_argument('--cross-prob', type=float, default=0.8)
+    islands.add_argument('--mut-prob', type=float, default=0.2)
+    islands.add_argument('--genome-length', type=int, default=10)
+    islands.add_argument('--optimum', type=float, default=0)
+    islands.add_argument('--moves', choices=['step', 'push'], default='step', help="genes are single steps or pushes")
+    islands.add_argument('--max-evaluations', type=int)
+    islands.add_argument('--plot', help="save the fitness plots to this file")
+    islands.add_argument('--metrics', help="save the run metrics to this JSON file")
+    islands.add_argument('--profile', action='store_true', help="sample the Python stack during the run (Unix)")
+    islands.set_defaults(run=run_islands)
+
+    astar = sub.add_parser('astar', parents=[common, heuristic], help="A* search")
+    astar.add_argument('--max-expansions', type=int)
+    astar.add_argument('--moves', choices=['step', 'push'], default='step', help="expand single steps or pushes")
+    astar.add_argument('--canonical', action='store_true',
+                       help="with --moves push, one node per box configuration and player region")
+    astar.add_argument('--prolog', action='store_true',
+                       help="run astar.pl through pyswip instead (bundled level only)")
+    astar.set_defaults(run=run_astar)
+
+    bidir = sub.add_parser('bidir', parents=[common], help="bidirectional push/pull search")
+    bidir.add_argument('--max-expansions', type=int)
+    bidir.set_defaults(run=run_bidir)
+
+    ids = sub.add_parser('ids', parents=[common, heuristic], help="iterative deepening (IDA*)")
+    ids.add_argument('--max-bound', type=int)
+    ids.add_argument('--max-expansions', type=int)
+    ids.add_argument('--prolog', action='store_true', help="run IT.pl through pyswip instead (bundled level only)")
+    ids.set_defaults(run=run_ids)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # astar.pl and IT.pl only know the bundled board
+    if getattr(args, 'prolog', False) and args.level:
+        parser.error("--prolog only solves the bundled level, it cannot be combined with --level")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    configure_tracing(args)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = args.run(args)
+    finally:
+        if args.trace != 'off':
+            import tracing
+            tracing.disable()
+    result = {'engine': args.engine, **result, 'time': time.perf_counter() - start}
+
+    if args.format == 'json':
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            if key == 'board':
+                print('board:')
+                print('\n'.join(value))
+            else:
+                print(f"{key}: {' '.join(value) if key == 'moves' and value else value}")
+    return result
+
+if __name__ == "__main__":
+    main()
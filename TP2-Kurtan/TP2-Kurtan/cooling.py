@@ -0,0 +1,65 @@
+import math
+
+# Cooling schedules for simulated_annealing. The temperature is lowered once
+# per block of k iterations: next(acceptance) gets the fraction of the block's
+# moves that were accepted and returns the temperature of the next block.
+# reheat(T) restarts the schedule from temperature T.
+
+# T = T0 * exp(-R * t), t counting the blocks since the start or the last reheat
+class Exponential:
+    def __init__(self, Tmax, Tmin, R):
+        self.R = R
+        self.T0 = Tmax
+        self.t = 0
+
+    def next(self, acceptance):
+        self.t += 1
+        return self.T0 * math.exp(-self.R * self.t)
+
+    def reheat(self, T):
+        self.T0 = T
+        self.t = 0
+
+# Lundy-Mees: T = T / (1 + beta * T), which cools slowly at low temperatures.
+# beta is chosen so that Tmax reaches Tmin in as many blocks as the
+# exponential schedule with the same R.
+class LundyMees:
+    def __init__(self, Tmax, Tmin, R):
+        blocks = max(1.0, math.log(Tmax / Tmin) / R)
+        self.beta = (1 / Tmin - 1 / Tmax) / blocks
+        self.T = Tmax
+
+    def next(self, acceptance):
+        self.T = self.T / (1 + self.beta * self.T)
+        return self.T
+
+    def reheat(self, T):
+        self.T = T
+
+# Exponential cooling whose rate follows the acceptance rate: a block that
+# accepted more than target of its moves (too hot) cools up to twice as fast
+# as exp(-R), one that accepted fewer cools down to half as fast
+class Adaptive:
+    def __init__(self, Tmax, Tmin, R, target=0.4):
+        self.R = R
+        self.target = target
+        self.T = Tmax
+
+    def next(self, acceptance):
+        ratio = min(2.0, max(0.5, acceptance / self.target))
+        self.T *= math.exp(-self.R * ratio)
+        return self.T
+
+    def reheat(self, T):
+        self.T = T
+
+SCHEDULES = {
+    'exponential': Exponential,
+    'adaptive': Adaptive,
+    'lundy-mees': LundyMees,
+}
+
+def make_schedule(name, Tmax, Tmin, R):
+    if name not in SCHEDULES:
+        raise ValueError(f"schedule must be one of {', '.join(SCHEDULES)}")
+    return SCHEDULES[name](Tmax, Tmin, R)
@@ -1,11 +1,18 @@
+import os
 import random
-import matplotlib.pyplot as plt
+import time
 from dataclasses import dataclass
-import numpy as np
-from kurtan_utils import GameState, apply_pull, find_gate_position, find_key_position, is_box_stuck, manhattan
-from copy import deepcopy
+from kurtan_utils import GameState, apply_pull, is_box_stuck, manhattan
 
 from tabuleiro import BOX, BOX_ON_TARGET, TARGET_POSITIONS, WALL
+from transposition import TranspositionTable
+from sim_cache import SimulationCache
+from parallel_eval import ParallelEvaluator
+from reachability import macro_moves
+from heuristics import box_term
+from metrics import Metrics, MetricsRecorder
+from anytime import ActiveTimer, Snapshot, finish
+import tracing
 
 @dataclass
 class GAResult:
@@ -18,6 +25,9 @@ class GAResult:
     u: any
     s: any
     Fit: list
+    metrics: Metrics = None
+    islands: list = None  # island_ga.IslandTrace per island for the island model
+    MeanFit: list = None
 
 # GA Genetic Algorithm
 #   Make t = 0;
@@ -30,13 +40,68 @@ class GAResult:
 #     Step 4 Mutate some solution from P(t)
 #     Step 5 Evaluate P(t)
     
-def genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense):
+# backend selects how the population is evaluated: 'python' replays each
+# individual through GameState (in worker processes when workers > 1) and
+# 'numpy' steps the whole population at once with batch_simulator.
+# plot: None for no plot, 'show' to open the windows or a file name to save them
+# max_evaluations: no generation is started that would go over this many
+# fitness evaluations (None for no limit)
+# profiler: optional metrics.SamplingProfiler (or anything with start/stop) run
+# around the search, its report ends up in result.metrics.profile
+def genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense, table=None, sim_cache=None, workers=1,
+                      backend='python', plot=None, max_evaluations=None, profiler=None):
+    result = finish(iter_genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense, table, sim_cache, workers,
+                                           backend, max_evaluations, profiler, stride=None))
+    caches = result.metrics.caches
+
+    print('BestCost:', result.Cost)
+    print('NumEvaluations:', result.NumEvaluations)
+    print(f"Cache hit rate: {caches['fitness']['hit_rate']:.2%} "
+          f"({caches['fitness']['hits']} hits, {caches['fitness']['misses']} misses)")
+    print(f"Replayed moves reused from the prefix cache: {caches['prefix']['reuse_rate']:.2%}")
+
+    if plot:
+        plot_fitness(result.Fit, result.MeanFit, len(result.Fit) - 1, data, plot)
+    return result
+
+# Anytime GA (see anytime.py): a generator with the arguments of
+# genetic_algorithm that yields a Snapshot every stride generations (only the
+# final one when stride is None). Closing it shuts the worker pool down.
+def iter_genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense, table=None, sim_cache=None, workers=1,
+                           backend='python', max_evaluations=None, profiler=None, stride=1):
+    args = (data, tmax, popSize, crossProb, mutProb, sense, table, sim_cache, max_evaluations, profiler, stride)
+    if backend == 'numpy':
+        if data.get('genes') == 'push' or data.get('heuristic', 'manhattan') != 'manhattan':
+            raise ValueError("the numpy backend only supports step genes and the manhattan heuristic")
+        from batch_simulator import BatchSimulator
+        return _genetic_algorithm(*args, BatchSimulator(data))
+    if backend != 'python':
+        raise ValueError("backend must be 'python' or 'numpy'")
+    if workers > 1:
+        return _pooled_genetic_algorithm(args, workers)
+    return _genetic_algorithm(*args, None)
+
+def _pooled_genetic_algorithm(args, workers):
+    with ParallelEvaluator(args[0], workers) as evaluator:
+        yield from _genetic_algorithm(*args, evaluator)
+
+def _genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense, table, sim_cache, max_evaluations, profiler,
+                       stride, evaluator):
+    recorder = MetricsRecorder(['selection', 'crossover', 'mutation', 'evaluation'], profiler)
+    timers = recorder.timers
+    timer = ActiveTimer()
+    if table is None:
+        table = TranspositionTable()
+    if sim_cache is None:
+        sim_cache = SimulationCache(get_initial_state(data))
 
     num_evaluations = 0
     found_optimum = False
 
     pop = get_initial_population(data, popSize)
-    pop_fit = evaluate_population(data, pop)
+    start = time.perf_counter()
+    pop_fit = evaluate_population(data, pop, table, sim_cache, evaluator)
+    timers['evaluation'] += time.perf_counter() - start
     num_evaluations += popSize
 
     Fit = []
@@ -44,35 +109,58 @@ def genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense):
 
     fu, _ = get_best_fitness(pop_fit, sense)
     Fit.append(fu)
-    MeanFit.append(np.mean(pop_fit))
+    MeanFit.append(sum(pop_fit) / len(pop_fit))
 
     t = 0
     while t < tmax and not found_optimum:
+        if max_evaluations is not None and num_evaluations + popSize > max_evaluations:
+            break
+        if stride is not None and t % stride == 0:
+            fu, I = get_best_fitness(pop_fit, sense)
+            yield Snapshot(fu, pop[I[0]], num_evaluations, timer.pause())
+            timer.resume()
         # Step 1 Increment iteration index
         t += 1
         # Step 2 Select the fittest from P(t-1) to build P(t)
+        start = time.perf_counter()
         pop = select(pop, pop_fit)
+        selected = time.perf_counter()
         # Step 3 Cross P(t)
         pop = cross(data, pop, crossProb)
+        crossed = time.perf_counter()
         # Step 4 Mutate some solution from P(t)
         pop = mutate(data, pop, mutProb)
+        mutated = time.perf_counter()
         # Step 5 Evaluate P(t)
-        pop_fit = evaluate_population(data, pop)
+        pop_fit = evaluate_population(data, pop, table, sim_cache, evaluator)
+        timers['selection'] += selected - start
+        timers['crossover'] += crossed - selected
+        timers['mutation'] += mutated - crossed
+        timers['evaluation'] += time.perf_counter() - mutated
 
         num_evaluations += popSize
         fu, _ = get_best_fitness(pop_fit, sense)
         print(f"Generation {t}, Best Fitness = {fu}")
         Fit.append(fu)
-        MeanFit.append(np.mean(pop_fit))
+        MeanFit.append(sum(pop_fit) / len(pop_fit))
+        if tracing.level >= tracing.INFO:
+            tracing.emit('generation', t=t, best=fu, mean=MeanFit[-1], evaluations=num_evaluations)
 
         if is_optimum(fu, data):
             found_optimum = True
 
     fu, I = get_best_fitness(pop_fit, sense)
     u = pop[I[0]]
+    metrics = recorder.finish(num_evaluations, {
+        'fitness': table.stats(),
+        'prefix': {'size': len(sim_cache), 'reused_moves': sim_cache.reused_moves,
+                   'simulated_moves': sim_cache.simulated_moves, 'reuse_rate': sim_cache.reuse_rate},
+    })
+    result = GAResult(num_evaluations, fu, tmax, popSize, crossProb, mutProb, u, u, Fit, metrics, MeanFit=MeanFit)
+    yield Snapshot(fu, u, num_evaluations, timer.pause(), True, result)
 
-    print('BestCost:', fu)
-    print('NumEvaluations:', num_evaluations)
+def plot_fitness(Fit, MeanFit, t, data, plot):
+    import matplotlib.pyplot as plt
 
     # Plot absolute fitness over generations
     plt.figure(1)
@@ -81,32 +169,73 @@ def genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense):
     plt.xlabel("Generation")
     plt.ylabel("Best Fitness")
     plt.grid(True)
-
-    # Plot fitness percentage vs. optimum
-    i = list(range(1, t + 2))
-    Fit_pct = [f / data['optimum'] * 100 for f in Fit]
-    MeanFit_pct = [m / data['optimum'] * 100 for m in MeanFit]
-    plt.figure(2)
-    plt.plot(i, Fit_pct, 'k-', label='Pop Max')
-    plt.plot(i, MeanFit_pct, 'k:', label='Pop Mean')
-    plt.xlabel('Generation no.')
-    plt.ylabel('Fitness (%)')
-    plt.axis([1, t + 1, 50, 110])
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-
-    return GAResult(num_evaluations, fu, tmax, popSize, crossProb, mutProb, u, u, Fit)
+    if plot != 'show':
+        plt.savefig(plot)
+
+    # Plot fitness percentage vs. optimum (undefined when the optimum is 0)
+    if data['optimum']:
+        i = list(range(1, t + 2))
+        Fit_pct = [f / data['optimum'] * 100 for f in Fit]
+        MeanFit_pct = [m / data['optimum'] * 100 for m in MeanFit]
+        plt.figure(2)
+        plt.plot(i, Fit_pct, 'k-', label='Pop Max')
+        plt.plot(i, MeanFit_pct, 'k:', label='Pop Mean')
+        plt.xlabel('Generation no.')
+        plt.ylabel('Fitness (%)')
+        plt.axis([1, t + 1, 50, 110])
+        plt.legend()
+        plt.grid(True)
+        if plot != 'show':
+            root, ext = os.path.splitext(plot)
+            plt.savefig(f"{root}_pct{ext or '.png'}")
+
+    if plot == 'show':
+        plt.show()
+    else:
+        plt.close('all')
 
 # Genetic algortihm utility functions
 def get_initial_population(data, pop_size):
-    return [generate_random_move_sequence(data['N']) for _ in range(pop_size)]
+    return [generate_random_move_sequence(data, data['N']) for _ in range(pop_size)]
 
 def generate_random_move_sequence(data, length=10):
-    return [random.choice(['up', 'down', 'left', 'right']) for _ in range(length)]
+    return [random_gene(data) for _ in range(length)]
+
+# data['genes'] picks the genome: 'step' (the default) has one direction per
+# gene, 'push' has one number per gene that picks among the macro moves of
+# reachability.macro_moves available at that point
+PUSH_GENES = 1 << 16
+
+def random_gene(data):
+    if data.get('genes') == 'push':
+        return random.randrange(PUSH_GENES)
+    return random.choice(['up', 'down', 'left', 'right'])
+
+# Individuals are looked up by their move sequence, so duplicates created by
+# selection are only simulated once. The ones not in the table are evaluated
+# in this process or by the evaluator (a worker pool or the batch simulator).
+def evaluate_population(data, population, table=None, sim_cache=None, evaluator=None):
+    keys = [tuple(individual) for individual in population]
+    pop_fit = [None] * len(population)
+    missing = {}
+    for i, key in enumerate(keys):
+        fitness = table.get(key) if table is not None else None
+        if fitness is None:
+            missing.setdefault(key, population[i])
+        else:
+            pop_fit[i] = fitness
+
+    individuals = list(missing.values())
+    if evaluator is not None:
+        results = evaluator.evaluate(individuals)
+    else:
+        results = [eval_func(individual, data, sim_cache) for individual in individuals]
+    evaluated = dict(zip(missing, results))
+    if table is not None:
+        for key, fitness in evaluated.items():
+            table.put(key, fitness)
 
-def evaluate_population(data, population):
-    return [eval_func(individual, data) for individual in population]
+    return [fitness if fitness is not None else evaluated[key] for fitness, key in zip(pop_fit, keys)]
 
 def get_best_fitness(pop_fit, sense):
     if sense == 'maximize':
@@ -153,76 +282,122 @@ def mutate(data, population, mut_prob):
     for individual in population:
         if random.random() < mut_prob:
             idx = random.randint(0, len(individual)-1)
-            individual[idx] = random.choice(['up', 'down', 'left', 'right'])
+            individual[idx] = random_gene(data)
     return population
 
-def eval_func(individual, data):
-    state = GameState(deepcopy(data['board']))
+def get_initial_state(data):
+    return data['state'] if 'state' in data else GameState(data['board'])
+
+# With a SimulationCache the simulation resumes from the longest prefix of the
+# individual that was already simulated
+def eval_func(individual, data, sim_cache=None):
     total_distance = 0
     penalty = 0
-    real_moves = 0
-    for move in individual:
-        success, _ = state.move(move)
-        if not success:
-            continue  # Try net moves
-        else:
-            real_moves += 1
-            print("----------------------------------")
-            print("After moving:", move)
-            state.print_board()
-            print("Player position:", state.player_pos)
-            if is_box_stuck(state, move):
-                print("Box stuck. before pull.")
-                pulled = apply_pull(state, move)
-                print("----------------------------------")
-                if pulled:
-                    state = pulled
-
-        if state.is_goal_state():
+    if sim_cache is None:
+        state = get_initial_state(data).clone()
+        tracing.counters['clones'] += 1
+        real_moves = 0
+        moves = individual
+    else:
+        node, depth = sim_cache.longest_prefix(individual)
+        if node.solved:
+            sim_cache.touch(node)
             return 0
-    board = state.board
-    box_positions = []
+        state = node.state.clone()
+        tracing.counters['clones'] += 1
+        real_moves = node.real_moves
+        moves = individual[depth:]
+
+    # the step, push and clone counters are added once per individual, not
+    # per move
+    push_genes = data.get('genes') == 'push'
+    replayed = real_moves
+    pushes = played = 0
+    solved = False
+    for move in moves:
+        played += 1
+        if push_genes:
+            state, path = play_macro(state, move)
+            real_moves += len(path)
+        else:
+            boxes = state.boxes
+            success, _ = state.move(move)
+            if success:
+                real_moves += 1
+                if state.boxes != boxes:
+                    pushes += 1
+                if tracing.level >= tracing.DEBUG:
+                    tracing.emit('move', direction=move, player=state.player_pos, board=state.board)
+                if is_box_stuck(state, move):
+                    pulled = apply_pull(state, move)
+                    if pulled:
+                        state = pulled
+
+        solved = state.is_goal_state()
+        if sim_cache is not None:
+            node = sim_cache.extend(node, move, state, real_moves, solved)
+        if solved:
+            break
+    if not push_genes:
+        tracing.counters['moves'] += real_moves - replayed
+        tracing.counters['pushes'] += pushes
+    if sim_cache is not None:
+        tracing.counters['clones'] += played
+        sim_cache.touch(node)
+    if solved:
+        return 0
 
     # 1. If the key is not visible, calculate the distance of the boxes to the targets
     if not state.key_visible:
-        for i, row in enumerate(board):
-            for j, cell in enumerate(row):
-                if cell in [BOX, BOX_ON_TARGET]:
-                    box_positions.append((i, j))
-
-        for (bx, by) in box_positions:
-            if (bx, by) not in TARGET_POSITIONS:
-                distances = [manhattan((bx, by), (tx, ty)) for (tx, ty) in TARGET_POSITIONS]
-                if distances:
-                    total_distance += min(distances)
-
-            # Penalise stuck boxes
-            blocked_sides = 0
-            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nx, ny = bx + dx, by + dy
-                if not state.is_within_bounds(nx, ny):
-                    blocked_sides += 1
-                else:
-                    neighbor = state.cell_at(nx, ny)
-                    if neighbor in [WALL, BOX, BOX_ON_TARGET]:
-                        blocked_sides += 1
-            if blocked_sides >= 3:
-                penalty += 20
+        total_distance = box_term(state) if data.get('heuristic') == 'assignment' else state.box_distance
+        penalty += 20 * state.stuck_boxes
 
     else:
         if not state.key_picked:
-            key_pos = find_key_position(state.board)
+            key_pos = state.key_pos
             penalty += manhattan(state.player_pos, key_pos)
         else :
-            gate_pos = find_gate_position(state.board)
+            gate_pos = state.gate_pos
             penalty += manhattan(state.player_pos, gate_pos)
     return real_moves + penalty + total_distance
 
+# Plays the macro move picked by gene on state (in place, as eval_func does
+# with single steps) and returns the new state and the steps taken
+def play_macro(state, gene):
+    paths = macro_moves(state)
+    if not paths:
+        return state, []
+    path = paths[gene % len(paths)]
+    for direction in path:
+        state.move(direction)
+    tracing.counters['moves'] += len(path)
+    if tracing.level >= tracing.DEBUG:
+        tracing.emit('macro', path=path, player=state.player_pos, board=state.board)
+    if is_box_stuck(state, path[-1]):
+        pulled = apply_pull(state, path[-1])
+        if pulled:
+            pulled.reveal_key()  # a pull bypasses move()
+            state = pulled
+    return state, path
+
+# The steps an individual stands for, up to the point where it solves the level
+def genes_to_moves(individual, data):
+    if data.get('genes') != 'push':
+        return list(individual)
+    state = get_initial_state(data).clone()
+    moves = []
+    for gene in individual:
+        if state.is_goal_state():
+            break
+        state, path = play_macro(state, gene)
+        moves.extend(path)
+    return moves
+
 def is_optimum(fitness, data):
     return fitness <= data['optimum']  # Define the optimum condition
 
 # Run the genetic algorithm
-def run_genetic_algorithm():
+def run_genetic_algorithm(workers=1, backend='python'):
     print("Genetic Algorithm (Python) selected.")
     tmax = 100
     popSize = 30
@@ -236,12 +411,24 @@ def run_genetic_algorithm():
     data = {
         'N': N,
         'optimum': optimum,
-        'board': initial_state.board
+        'board': initial_state.board,
+        'state': initial_state
     }
 
     genetic_algorithm(
         data, tmax, popSize, crossProb, mutProb,
-        sense
+        sense, workers=workers, backend=backend, plot='show'
     )
 
     print("Final solution:")
+
+# Run the island model GA, one island per core
+def run_island_genetic_algorithm():
+    from island_ga import island_genetic_algorithm
+    print("Island Model Genetic Algorithm (Python) selected.")
+    initial_state = GameState()
+    data = {'N': 10, 'optimum': 0, 'board': initial_state.board, 'state': initial_state}
+    result = island_genetic_algorithm(data, 100, 30, 0.8, 0.2, 'minimize', plot='show')
+    print(f"Islands: {len(result.islands)}, immigrants: {sum(trace.immigrants for trace in result.islands)}")
+    print("Final solution:", ' '.join(genes_to_moves(result.u, data)))
+    return result
@@ -0,0 +1,196 @@
+import functools
+from collections import deque
+
+from kurtan_utils import manhattan
+from tabuleiro import GameState
+from transposition import TranspositionTable
+
+# Box heuristics that know about walls, shared by SA, GA and A*.
+#
+# push_distances(layout) holds, for every target, the number of pushes a lone
+# box needs to get there from each cell (found by pulling a box backwards from
+# the target, so walls, the gate and corners are taken into account). The
+# assignment bound is the cost of the cheapest way to give every target its
+# own box, found with the Hungarian algorithm. It never overestimates the
+# pushes left, so lower_bound() is admissible for A* and IDA*.
+
+UNREACHABLE = 10 ** 6
+DEADLOCK_PENALTY = 20
+
+# distance[t][cell]: pushes from cell to target_cells[t], UNREACHABLE if none
+@functools.lru_cache(maxsize=32)
+def push_distances(layout):
+    neighbours = layout.neighbours
+    tables = []
+    for target in layout.target_cells:
+        distance = [UNREACHABLE] * (layout.rows * layout.cols)
+        distance[target] = 0
+        queue = deque([target])
+        while queue:
+            box = queue.popleft()
+            for d in range(4):
+                cell = neighbours[d][box]  # the box is pulled here
+                if layout.is_solid(cell) or layout.is_solid(neighbours[d][cell]):
+                    continue
+                if distance[cell] == UNREACHABLE:
+                    distance[cell] = distance[box] + 1
+                    queue.append(cell)
+        tables.append(tuple(distance))
+    return tuple(tables)
+
+# Hungarian algorithm (shortest augmenting paths with potentials). a is
+# 1-indexed with n rows and m >= n columns; u and v are the row and column
+# potentials and p[j] the row matched to column j (0 for none). Adds row i0 to
+# the matching.
+def _augment(a, u, v, p, i0, m):
+    INF = float('inf')
+    minv = [INF] * (m + 1)
+    used = [False] * (m + 1)
+    way = [0] * (m + 1)
+    p[0] = i0
+    j0 = 0
+    while True:
+        used[j0] = True
+        i = p[j0]
+        delta = INF
+        j1 = 0
+        for j in range(1, m + 1):
+            if not used[j]:
+                cur = a[i][j] - u[i] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+        for j in range(m + 1):
+            if used[j]:
+                u[p[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if p[j0] == 0:
+            break
+    while j0:
+        j1 = way[j0]
+        p[j0] = p[j1]
+        j0 = j1
+
+# Optimal matching of the targets (rows) to the boxes (columns) of one box set
+class Assignment:
+    __slots__ = ('boxes', 'cells', 'a', 'u', 'v', 'p', 'cost')
+
+    def __init__(self, boxes, cells, a, u, v, p):
+        self.boxes = boxes
+        self.cells = cells
+        self.a = a
+        self.u = u
+        self.v = v
+        self.p = p
+        self.cost = sum(a[p[j]][j] for j in range(1, len(p)) if p[j])
+
+    @classmethod
+    def solve(cls, distance, boxes, cells):
+        n, m = len(distance), len(cells)
+        a = [None] + [[0] + [row[c] for c in cells] for row in distance]
+        u, v, p = [0] * (n + 1), [0] * (m + 1), [0] * (m + 1)
+        for i in range(1, n + 1):
+            _augment(a, u, v, p, i, m)
+        return cls(boxes, cells, a, u, v, p)
+
+    # The same matching after the box in cell src moved to dst: the box's
+    # column gets its new costs and its potential is lowered until it is
+    # feasible again, then the target it was matched to is matched again with
+    # a single augmenting path, O(n^2) instead of O(n^3). Only valid with as
+    # many boxes as targets, where no column is left free.
+    def moved(self, distance, boxes, src, dst):
+        j = self.cells.index(src) + 1
+        cells = list(self.cells)
+        cells[j - 1] = dst
+        a = [None] + [row[:] for row in self.a[1:]]
+        u, v, p = self.u[:], self.v[:], self.p[:]
+        for i in range(1, len(a)):
+            a[i][j] = distance[i - 1][dst]
+        v[j] = min(a[i][j] - u[i] for i in range(1, len(a)))
+        i = p[j]
+        p[j] = 0
+        _augment(a, u, v, p, i, len(cells))
+        return Assignment(boxes, cells, a, u, v, p)
+
+# Assignment bound of a level, cached per box set. A box set not in the cache
+# that differs from one of the last few solved sets by a single box is solved
+# incrementally from it (the usual case in a search, where a child differs
+# from its parent by one push).
+class AssignmentBound:
+    def __init__(self, layout, size=100000, recent=8):
+        self.layout = layout
+        self.distance = push_distances(layout)
+        self.table = TranspositionTable(size)
+        self.recent = deque(maxlen=recent)
+        self.incremental = 0
+        self.full = 0
+
+    def solution(self, boxes):
+        solution = self.table.get(boxes)
+        if solution is None:
+            solution = self.solve(boxes)
+            self.table.put(boxes, solution)
+        self.recent.append(solution)
+        return solution
+
+    def solve(self, boxes):
+        n = len(self.distance)
+        for previous in reversed(self.recent):
+            changed = previous.boxes ^ boxes
+            if len(previous.cells) == n and bin(changed).count('1') == 2:
+                src = (previous.boxes & changed).bit_length() - 1
+                dst = (boxes & changed).bit_length() - 1
+                self.incremental += 1
+                return previous.moved(self.distance, boxes, src, dst)
+        self.full += 1
+        cells = [i for i in range(boxes.bit_length()) if boxes >> i & 1]
+        if len(cells) < n:
+            return Assignment(boxes, cells, [None], [0], [0] * (len(cells) + 1), [0] * (len(cells) + 1))
+        return Assignment.solve(self.distance, boxes, cells)
+
+    # Fewest pushes that can put a box on every target, None if impossible
+    def __call__(self, boxes):
+        solution = self.solution(boxes)
+        if len(solution.cells) < len(self.distance) or solution.cost >= UNREACHABLE:
+            return None
+        return solution.cost
+
+@functools.lru_cache(maxsize=32)
+def assignment_bound(layout):
+    return AssignmentBound(layout)
+
+def box_bound(state: GameState):
+    return assignment_bound(state.layout)(state.boxes)
+
+# Box term for the eval_funcs: the assignment bound, or the Manhattan sum
+# plus a deadlock penalty when no assignment exists
+def box_term(state: GameState):
+    bound = box_bound(state)
+    if bound is None:
+        return state.box_distance + DEADLOCK_PENALTY
+    return bound
+
+# Admissible estimate of the steps left, for A* and IDA*. The boxes need at
+# least the assignment bound in pushes. With legs=True the key and gate walks
+# count too: before the key is out, at least one step to take it and one to
+# leave after the last push; once it is out, the Manhattan walks to the key
+# and the gate, which can overlap with pushes, so only the larger part counts.
+def lower_bound(state: GameState, legs=True):
+    if state.game_over:
+        return 0
+    bound = box_bound(state)
+    if bound is None:
+        return float('inf')
+    if not legs or state.layout.gate < 0:
+        return bound
+    if state.key_picked:
+        return max(bound, manhattan(state.player_pos, state.gate_pos))
+    if state.key_visible:
+        return max(bound, manhattan(state.player_pos, state.key_pos) + manhattan(state.key_pos, state.gate_pos))
+    return bound + 2
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from genetic_algorithm import (GAResult, cross, evaluate_population, get_best_fitness, get_initial_population,
+                               get_initial_state, is_optimum, mutate, plot_fitness, select)
+from metrics import MetricsRecorder
+from sim_cache import SimulationCache
+from transposition import TranspositionTable
+
+@dataclass
+class IslandTrace:
+    Fit: list  # best fitness of the island after each generation
+    MeanFit: list
+    evaluations: int = 0
+    immigrants: int = 0  # individuals received from other islands
+
+# Islands send their elites to these islands after every migration interval:
+# 'ring' to the next island, 'complete' to all others and 'random' to one other
+# island picked again at every migration. A list with one list of island
+# indices per island gives any other topology.
+TOPOLOGIES = ('ring', 'complete', 'random')
+
+def migration_targets(topology, islands, rng):
+    if not isinstance(topology, str):
+        if len(topology) != islands:
+            raise ValueError("the topology needs one list of destinations per island")
+        return [list(targets) for targets in topology]
+    if islands == 1:
+        return [[]]
+    if topology == 'ring':
+        return [[(i + 1) % islands] for i in range(islands)]
+    if topology == 'complete':
+        return [[j for j in range(islands) if j != i] for i in range(islands)]
+    if topology == 'random':
+        return [[rng.choice([j for j in range(islands) if j != i])] for i in range(islands)]
+    raise ValueError(f"topology must be one of {', '.join(TOPOLOGIES)} or a list of destinations")
+
+def _elites(pop, pop_fit, sense, migrants):
+    order = sorted(range(len(pop)), key=pop_fit.__getitem__, reverse=sense == 'maximize')
+    return [(list(pop[i]), pop_fit[i]) for i in order[:migrants]]
+
+# One island: the usual select/cross/mutate/evaluate loop on its own
+# population, with its own fitness table and prefix cache. Every message from
+# the main process brings the immigrants, which replace the island's worst
+# individuals, and the number of generations to run before the next
+# migration. The reply has the fitness trace of those generations, the
+# evaluations done, the island's elites and its best individual.
+def _island(conn, data, popSize, crossProb, mutProb, sense, migrants, seed):
+    random.seed(seed)
+    table = TranspositionTable()
+    sim_cache = SimulationCache(get_initial_state(data))
+    pop = get_initial_population(data, popSize)
+    pop_fit = evaluate_population(data, pop, table, sim_cache)
+
+    def report(Fit, MeanFit, evaluations):
+        fu, I = get_best_fitness(pop_fit, sense)
+        conn.send((Fit, MeanFit, evaluations, _elites(pop, pop_fit, sense, migrants), fu, pop[I[0]]))
+
+    fu, _ = get_best_fitness(pop_fit, sense)
+    report([fu], [sum(pop_fit) / len(pop_fit)], popSize)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        immigrants, generations = message
+        if immigrants:
+            worst = sorted(range(len(pop)), key=pop_fit.__getitem__, reverse=sense == 'minimize')
+            for i, (individual, fitness) in zip(worst, immigrants):
+                pop[i], pop_fit[i] = individual, fitness
+        Fit, MeanFit = [], []
+        evaluations = 0
+        for _ in range(generations):
+            pop = select(pop, pop_fit)
+            pop = cross(data, pop, crossProb)
+            pop = mutate(data, pop, mutProb)
+            pop_fit = evaluate_population(data, pop, table, sim_cache)
+            evaluations += popSize
+            fu, _ = get_best_fitness(pop_fit, sense)
+            Fit.append(fu)
+            MeanFit.append(sum(pop_fit) / len(pop_fit))
+            if is_optimum(fu, data):
+                break
+        report(Fit, MeanFit, evaluations)
+    conn.close()
+
+# Island model GA: islands sub-populations of popSize individuals, each
+# evolved by the plain GA in a worker process. Every interval generations
+# each island sends copies of its best migrants individuals along the
+# migration topology, where they replace the worst individuals. Only the
+# elites and the traces cross the process boundaries. The run stops after
+# tmax generations, when an island reaches the optimum, or before a
+# migration interval that would go over max_evaluations. The result's Fit is
+# the best fitness over all islands after each generation and islands holds
+# one IslandTrace per island.
+def island_genetic_algorithm(data, tmax, popSize, crossProb, mutProb, sense='minimize', islands=None,
+                             topology='ring', interval=10, migrants=2, max_evaluations=None, seed=None,
+                             plot=None, profiler=None):
+    islands = islands or os.cpu_count() or 1
+    if sense not in ('minimize', 'maximize'):
+        raise ValueError("sense must be 'maximize' or 'minimize'")
+    rng = random.Random(seed)
+    migration_targets(topology, islands, rng)  # reject a bad topology before starting the workers
+    recorder = MetricsRecorder(['islands', 'migration'], profiler)
+
+    connections, processes = [], []
+    for i in range(islands):
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_island, args=(child, data, popSize, crossProb, mutProb, sense, migrants, rng.randrange(2 ** 32))
+        )
+        process.start()
+        child.close()
+        connections.append(parent)
+        processes.append(process)
+
+    traces = [IslandTrace([], []) for _ in range(islands)]
+    elites = [[] for _ in range(islands)]
+    best_fit, best = None, None
+    num_evaluations = 0
+    t = 0
+    Fit, MeanFit = [], []
+
+    def collect():
+        nonlocal best_fit, best, num_evaluations
+        start = time.perf_counter()
+        for i, conn in enumerate(connections):
+            island_fit, island_mean, evaluations, elites[i], fu, u = conn.recv()
+            trace = traces[i]
+            trace.Fit.extend(island_fit)
+            trace.MeanFit.extend(island_mean)
+            trace.evaluations += evaluations
+            num_evaluations += evaluations
+            if best_fit is None or (fu < best_fit if sense == 'minimize' else fu > best_fit):
+                best_fit, best = fu, u
+        # islands that stopped early at the optimum repeat their last value
+        # so that the combined trace lines up generation by generation
+        length = max(len(trace.Fit) for trace in traces)
+        for g in range(len(Fit), length):
+            Fit.append(get_best_fitness([trace.Fit[min(g, len(trace.Fit) - 1)] for trace in traces], sense)[0])
+            MeanFit.append(sum(trace.MeanFit[min(g, len(trace.MeanFit) - 1)] for trace in traces) / islands)
+        recorder.timers['islands'] += time.perf_counter() - start
+
+    try:
+        collect()
+        while t < tmax and not is_optimum(best_fit, data):
+            generations = min(interval, tmax - t)
+            if max_evaluations is not None:
+                generations = min(generations, (max_evaluations - num_evaluations) // (islands * popSize))
+            if generations <= 0:
+                break
+            start = time.perf_counter()
+            immigrants = [[] for _ in range(islands)]
+            for source, targets in enumerate(migration_targets(topology, islands, rng)):
+                for target in targets:
+                    immigrants[target].extend(elites[source])
+            for i, conn in enumerate(connections):
+                traces[i].immigrants += len(immigrants[i][:popSize])
+                conn.send((immigrants[i][:popSize], generations))
+            recorder.timers['migration'] += time.perf_counter() - start
+            collect()
+            t = len(Fit) - 1
+            print(f"Generation {t}, Best Fitness = {best_fit}")
+    finally:
+        for conn in connections:
+            conn.send(None)
+            conn.close()
+        for process in processes:
+            process.join()
+
+    metrics = recorder.finish(num_evaluations)
+    print('BestCost:', best_fit)
+    print('NumEvaluations:', num_evaluations)
+
+    if plot:
+        plot_fitness(Fit, MeanFit, len(Fit) - 1, data, plot)
+
+    return GAResult(num_evaluations, best_fit, tmax, popSize, crossProb, mutProb, best, best, Fit, metrics, traces,
+                    MeanFit)
@@ -1,48 +1,59 @@
 from tabuleiro import (
     GameState, TARGET_POSITIONS,
     EMPTY, TARGET, PLAYER, BOX_ON_TARGET, BOX, WALL, GATE, KEY,
-    direction_to_delta
+    DIRECTION_INDEX, direction_to_delta
 )
 import random
+import tracing
 
+# Unstick trick: a box pushed against a wall, the gate, another box or the key
+# is pulled back one cell. Only plain boxes are pulled, not boxes on targets.
 def apply_pull(state: GameState, d:str):
     px, py = state.player_pos
-    print("Player position:", px, py)
-    print("Applying pull in direction relative to player:", d)
     dx, dy = direction_to_delta(d)
     bx, by = px + dx, py + dy
 
     box_cell = state.cell_at(bx, by)
     behind_box_x, behind_box_y = bx + dx, by + dy
-    print("Box position:", bx, by)
-    print("Behind box position:", behind_box_x, behind_box_y)
-    print("Box cell:", box_cell)
     # BOX_ON_TARGET
     if box_cell in [BOX] and state.is_within_bounds(behind_box_x, behind_box_y): 
         behind_cell = state.cell_at(behind_box_x, behind_box_y)
-        print("Pulling box...")
         #WALL
         if behind_cell in [WALL, GATE, BOX, KEY]:
-            new_state = state.clone()
-
-            # Move player in the oposite direction
-            new_state.board[px][py] = TARGET if (px, py) in TARGET_POSITIONS else EMPTY
-            # Move box to the last player position
-            new_state.board[px][py] = BOX_ON_TARGET if (px, py) in TARGET_POSITIONS else BOX
-            # Clean the box last position
-            new_state.board[bx][by] = TARGET if (bx, by) in TARGET_POSITIONS else EMPTY
-
-            new_px, new_py = px - dx, py - dy
-            new_state.board[new_px][new_py] = PLAYER
-            new_state.player_pos = (new_px, new_py)
-
-            print("Box stuck. After pull:")
-            print("----------------------------------")
-            new_state.print_board()
-            return new_state
-    print("Box cannot be pulled.")
+            new_state = pull(state, d)
+            if new_state is not None:
+                if tracing.level >= tracing.DEBUG:
+                    tracing.emit('pull', direction=d, box=(bx, by), player=new_state.player_pos,
+                                 board=new_state.board)
+                return new_state
+    if tracing.level >= tracing.DEBUG:
+        tracing.emit('pull_failed', direction=d, player=(px, py), box=(bx, by), box_cell=box_cell)
     return None
 
+# Reverse move: with the player on cell player (default: where it is) and a box
+# next to it in direction d, the player steps back against d and drags the box
+# into the cell it left. Returns the new state, or None when there is no box
+# there or the cell behind the player is not free. Used by apply_pull and by
+# the backward search (search.pull_successors).
+def pull(state: GameState, d: str, player=None):
+    layout = state.layout
+    player = state.player if player is None else player
+    i = DIRECTION_INDEX[d]
+    box = layout.neighbours[i][player]
+    back = layout.neighbours[i ^ 1][player]
+    if box < 0 or not state.boxes >> box & 1:
+        return None
+    if back < 0 or (layout.walls | state.boxes) >> back & 1 or back == layout.gate or back == state.key:
+        return None
+    new_state = state.clone()
+    tracing.counters['clones'] += 1
+    new_state.move_box(box, player)
+    new_state.update_board(back)
+    tracing.counters['pulls'] += 1
+    return new_state
+
+# O(1): dead squares are precomputed per level and the freeze check only looks
+# at the box neighbours
 def is_box_stuck(state: GameState, direction: str):
     px, py = state.player_pos
     dx, dy = direction_to_delta(direction)
@@ -51,49 +62,12 @@ def is_box_stuck(state: GameState, direction: str):
     if not state.is_within_bounds(bx, by):
         return False  # Box is out of bounds
 
-    box_cell = state.cell_at(bx, by)
-    if box_cell not in [BOX]:
-        return False  # Not a box
-
-    blocked_sides = []
-    for ddx, ddy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-        nx, ny = bx + ddx, by + ddy
-        if not state.is_within_bounds(nx, ny) or state.cell_at(nx, ny) in [WALL, BOX, BOX_ON_TARGET]:
-            blocked_sides.append((ddx, ddy))
-    print("Blocked sides:", blocked_sides)
-    if len(blocked_sides) == 0:
-        return False
-    if len(blocked_sides) == 1:
-        # Verify if a future position can be a corner
-        forward_x, forward_y = bx + dx, by + dy
-        if state.is_within_bounds(forward_x, forward_y):
-            if stuck_helper(state, (forward_x, forward_y)):
-                return True
-            
-    if len(blocked_sides) >= 3:
+    if state.is_stuck(state.layout.index(bx, by)):
+        tracing.counters['stuck'] += 1
+        if tracing.level >= tracing.DEBUG:
+            tracing.emit('stuck', direction=direction, box=(bx, by))
         return True
-    if len(blocked_sides) == 2:
-        # Check if the two blocked sides are opposite
-        if (blocked_sides[0][0] != 0 and blocked_sides[1][1] != 0 or
-            blocked_sides[0][1] != 0 and blocked_sides[1][0] != 0):
-            return True
     return False
-    
-def stuck_helper(state: GameState, pos: tuple):
-    x, y = pos
-    wall_like = [WALL, BOX, BOX_ON_TARGET]
-    blocked_sides = 0
-
-    for dx, dy in [(-1,0), (1,0), (0,-1), (0,1)]:
-        nx, ny = x + dx, y + dy
-        if not state.is_within_bounds(nx, ny):
-            blocked_sides += 1
-        else:
-            neighbor = state.cell_at(nx, ny)
-            if neighbor in wall_like:
-                blocked_sides += 1
-
-    return blocked_sides >= 3  # Trap if the next posittion is limited
 
 
 def find_key_position(board):
@@ -0,0 +1,121 @@
+import hashlib
+import itertools
+import mmap
+from dataclasses import dataclass, field
+
+from tabuleiro import (
+    GameState, Layout, TARGET_POSITIONS,
+    EMPTY, TARGET, PLAYER, BOX_ON_TARGET, BOX, WALL, GATE, KEY
+)
+
+# Standard Sokoban characters, plus the Kurtan gate and key
+SOKOBAN_CELLS = {
+    '#': WALL, ' ': EMPTY, '-': EMPTY, '_': EMPTY,
+    '.': TARGET, '$': BOX, '*': BOX_ON_TARGET, '@': PLAYER, '+': PLAYER,
+    'G': GATE, 'K': KEY,
+}
+KURTAN_CELLS = {WALL, EMPTY, TARGET, BOX, BOX_ON_TARGET, PLAYER, GATE, KEY}
+BOARD_CHARS = set(SOKOBAN_CELLS) | KURTAN_CELLS
+
+# A level: its board in tabuleiro characters, its targets and the Layout all
+# its states share. Several levels can be loaded side by side.
+@dataclass
+class Level:
+    name: str
+    board: list
+    targets: list
+    layout: Layout = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.layout = Layout.from_board(self.board, self.targets)
+
+    def initial_state(self):
+        key_visible = any(KEY in row for row in self.board)
+        return GameState(self.board, key_visible=key_visible, layout=self.layout)
+
+    # Same for the same board and targets whatever the name, the file format
+    # or the padding at the end of the rows
+    def canonical_hash(self):
+        rows = [''.join(row).rstrip() for row in self.board]
+        while rows and not rows[-1]:
+            rows.pop()
+        text = '\n'.join(rows) + '\n' + ' '.join(f"{x},{y}" for x, y in sorted(self.targets))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    # '#' walls, '.' targets, '$' boxes, '*' boxes on targets, '@' player and
+    # '+' player on a target, with 'G' and 'K' for the Kurtan gate and key
+    @classmethod
+    def from_sokoban(cls, lines, name=''):
+        cols = max(len(line) for line in lines)
+        board = []
+        targets = []
+        for i, line in enumerate(lines):
+            row = []
+            for j, char in enumerate(line.ljust(cols)):
+                if char in '.*+':
+                    targets.append((i, j))
+                row.append(SOKOBAN_CELLS[char])
+            board.append(row)
+        return cls(name, board, targets)
+
+    # The characters used by tabuleiro.py ('X' walls, '*' targets, '@' boxes,
+    # '$' boxes on targets, 'P' player, 'G' gate, 'K' key)
+    @classmethod
+    def from_kurtan(cls, lines, name=''):
+        cols = max(len(line) for line in lines)
+        board = [list(line.ljust(cols)) for line in lines]
+        targets = [(i, j) for i, row in enumerate(board) for j, cell in enumerate(row) if cell in [TARGET, BOX_ON_TARGET]]
+        return cls(name, board, targets)
+
+    # fmt is 'sokoban', 'kurtan' or None to tell them apart by the wall character
+    @classmethod
+    def parse(cls, lines, name='', fmt=None):
+        if fmt is None:
+            fmt = 'sokoban' if any('#' in line for line in lines) else 'kurtan'
+        if fmt == 'sokoban':
+            return cls.from_sokoban(lines, name)
+        if fmt == 'kurtan':
+            return cls.from_kurtan(lines, name)
+        raise ValueError("fmt must be 'sokoban', 'kurtan' or None")
+
+def bundled_level():
+    return Level('bundled', GameState.initial_board(), list(TARGET_POSITIONS))
+
+def is_board_line(line):
+    return bool(line.strip()) and set(line) <= BOARD_CHARS and ('#' in line or WALL in line)
+
+# Yields the levels of a collection one at a time. The file is memory-mapped
+# and read line by line, so only the level being parsed is held in memory.
+# Levels are separated by any non-board line; the last comment or title line
+# before a level (';' comments included) becomes its name.
+def iter_levels(path, fmt=None):
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+        with mm:
+            block = []
+            name = None
+            count = 0
+            for raw in iter(mm.readline, b''):
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if is_board_line(line):
+                    block.append(line)
+                    continue
+                if block:
+                    count += 1
+                    yield Level.parse(block, name or str(count), fmt)
+                    block = []
+                    name = None
+                text = line.strip().lstrip(';').strip()
+                if text:
+                    name = text
+            if block:
+                yield Level.parse(block, name or str(count + 1), fmt)
+
+def load_level(path, index=0, fmt=None):
+    try:
+        return next(itertools.islice(iter_levels(path, fmt), index, None))
+    except StopIteration:
+        raise IndexError(f"{path} has no level {index}") from None
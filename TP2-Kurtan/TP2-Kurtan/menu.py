@@ -1,8 +1,8 @@
-from pyswip import Prolog
-from simulated_annealing import run_simulated_annealing
-from genetic_algorithm import run_genetic_algorithm
 import os
 
+# Solver modules (and pyswip) are imported by the mode that needs them, so the
+# menu starts without loading the ones that are not used
+
 def show_menu():
     print("====== Kurtan Game Menu ======")
     print("1. Player Mode")
@@ -10,28 +10,63 @@ def show_menu():
     print("3. A* (Best-First Search) Mode")
     print("4. Simulated Annealing Mode (Python)")
     print("5. Genetic Algorithm Mode (Python)")
-    print("Choose an option (1-5): ", end='')
+    print("6. Parallel Tempering Mode (Python)")
+    print("7. Island Model Genetic Algorithm Mode (Python)")
+    print("Choose an option (1-7): ", end='')
 
 def run_player_mode():
     print("Player mode selected.")
     os.system("swipl -g start_game -s tabuleiro.pl")
 
 def run_iterative_deepening():
-    print("Iterative Deepening selected.")
-    prolog = Prolog()
-    prolog.consult("tabuleiro.pl")
-    prolog.consult("IT.pl")
-    query = "solve_ids."
-    for result in prolog.query(query):
+    from search import ida_star
+    print("Iterative Deepening (IDA*) selected.")
+    result = ida_star()
+    if result.solved:
         print("Solution found!")
+        print("Moves:", ' '.join(result.moves))
+    else:
+        print("No path found.")
+    print(f"Cost: {result.cost}, iterations: {result.iterations}, expanded: {result.expanded}, "
+          f"generated: {result.generated}, time: {result.time:.4f}s")
+    return result
+
+def run_iterative_deepening_prolog():
+    from prolog_pool import default_pool
+    print("Iterative Deepening (Prolog) selected.")
+    return print_prolog_result(default_pool().solve('ids'))
 
 def run_astar():
+    from search import astar
     print("A* selected.")
-    prolog = Prolog()
-    prolog.consult("astar.pl")
-    query = "show_path"
-    for result in prolog.query(query):
+    result = astar()
+    if result.solved:
+        print("Solution found!")
+        print("Moves:", ' '.join(result.moves))
+    else:
+        print("No path found.")
+    print(f"Cost: {result.cost}, expanded: {result.expanded}, generated: {result.generated}, "
+          f"max open: {result.max_open}, time: {result.time:.4f}s")
+    return result
+
+def run_astar_prolog():
+    from prolog_pool import default_pool
+    print("A* (Prolog) selected.")
+    return print_prolog_result(default_pool().solve('astar'))
+
+# The Prolog engines run in a pool of pre-consulted processes (prolog_pool.py)
+# and send back their moves and expansion count
+def print_prolog_result(result):
+    if result is None:
+        print("The Prolog engine stopped.")
+        return result
+    if result.solved:
         print("Solution found!")
+        print("Moves:", ' '.join(result.moves))
+    else:
+        print("No path found.")
+    print(f"Cost: {result.cost}, expanded: {result.expanded}, time: {result.time:.4f}s")
+    return result
 
 def main():
     show_menu()
@@ -48,11 +83,19 @@ def main():
     elif option == 3:
         run_astar()
     elif option == 4:
+        from simulated_annealing import run_simulated_annealing
         run_simulated_annealing()
     elif option == 5:
+        from genetic_algorithm import run_genetic_algorithm
         run_genetic_algorithm()
+    elif option == 6:
+        from simulated_annealing import run_parallel_tempering
+        run_parallel_tempering()
+    elif option == 7:
+        from genetic_algorithm import run_island_genetic_algorithm
+        run_island_genetic_algorithm()
     else:
-        print("Invalid option. Please choose a number between 1 and 5.")
+        print("Invalid option. Please choose a number between 1 and 7.")
 
 if __name__ == "__main__":
     main()
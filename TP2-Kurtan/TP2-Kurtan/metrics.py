@@ -0,0 +1,112 @@
+import json
+import signal
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+
+import tracing
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Run metrics attached to SAResult and GAResult. timers holds the seconds
+# spent per phase, clones the GameState copies made by this process (not by GA
+# worker processes or the numpy backend) and caches the statistics of each
+# cache the run used. peak_memory is the peak resident size of the process in
+# bytes, so it covers everything run before as well.
+@dataclass
+class Metrics:
+    wall_time: float = 0.0
+    evaluations: int = 0
+    timers: dict = field(default_factory=dict)
+    clones: int = 0
+    caches: dict = field(default_factory=dict)
+    peak_memory: int = None
+    profile: dict = None
+
+    @property
+    def evaluations_per_sec(self):
+        return self.evaluations / self.wall_time if self.wall_time else 0.0
+
+    def to_dict(self):
+        return {**asdict(self), 'evaluations_per_sec': self.evaluations_per_sec}
+
+    def to_json(self, path=None):
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+def peak_memory():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+
+# Collects the metrics of one run. The engine adds to timers itself (plain
+# perf_counter differences, cheap enough for the inner loops) and calls
+# finish() at the end. profiler is any object with start() and stop(), stop()
+# returning something JSON serialisable, e.g. a SamplingProfiler.
+class MetricsRecorder:
+    def __init__(self, phases, profiler=None):
+        self.timers = dict.fromkeys(phases, 0.0)
+        self.profiler = profiler
+        self.clones = tracing.counters['clones']
+        if profiler is not None:
+            profiler.start()
+        self.start = time.perf_counter()
+
+    def finish(self, evaluations, caches=None):
+        wall_time = time.perf_counter() - self.start
+        profile = self.profiler.stop() if self.profiler is not None else None
+        return Metrics(wall_time, evaluations, self.timers, tracing.counters['clones'] - self.clones,
+                       caches or {}, peak_memory(), profile)
+
+# Statistical profiler: a SIGPROF timer interrupts the process every interval
+# seconds of CPU time and the Python stack at that moment is counted. The
+# report lists the functions seen most often, with the samples where they were
+# running (self) and where they were anywhere on the stack (total). Unix only,
+# and it must be started from the main thread.
+class SamplingProfiler:
+    def __init__(self, interval=0.001, top=20):
+        self.interval = interval
+        self.top = top
+        self.own = Counter()
+        self.total = Counter()
+        self.samples = 0
+        self.previous = None
+
+    def sample(self, signum, frame):
+        self.samples += 1
+        seen = set()
+        own = True
+        while frame is not None:
+            code = frame.f_code
+            name = f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+            if own:
+                self.own[name] += 1
+                own = False
+            if name not in seen:
+                seen.add(name)
+                self.total[name] += 1
+            frame = frame.f_back
+
+    def start(self):
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous or signal.SIG_DFL)
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            'functions': [
+                {'function': name, 'self': self.own[name], 'total': count}
+                for name, count in self.total.most_common(self.top)
+            ],
+        }
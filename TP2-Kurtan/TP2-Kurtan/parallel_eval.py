@@ -0,0 +1,81 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sim_cache import SimulationCache
+
+# Per worker state, set once by _init_worker when the process starts
+_data = None
+_sim_cache = None
+
+def _init_worker(data):
+    global _data, _sim_cache
+    from genetic_algorithm import get_initial_state
+    _data = data
+    _sim_cache = SimulationCache(get_initial_state(data))
+
+def _eval_chunk(chunk):
+    from genetic_algorithm import eval_func
+    return [eval_func(individual, _data, _sim_cache) for individual in chunk]
+
+# Persistent pool of worker processes for GA fitness evaluation. The level in
+# data is sent to each worker once at start-up; afterwards only chunks of
+# move sequences and their fitness values cross the process boundary.
+class ParallelEvaluator:
+    def __init__(self, data, workers=None, chunk_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(data,)
+        )
+
+    def evaluate(self, population):
+        if not population:
+            return []
+        size = self.chunk_size or math.ceil(len(population) / (self.workers * 4))
+        chunks = [population[i:i + size] for i in range(0, len(population), size)]
+        return [fitness for part in self.executor.map(_eval_chunk, chunks) for fitness in part]
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Times the evaluation of the same population with the serial path and with
+# each worker count, and returns {workers: (seconds, speedup)}. Every path
+# starts from prefix caches that have only seen a separate warm-up
+# population, so none of them gets the measured individuals for free; the
+# workers still split the population over their own caches, as in a GA run.
+def measure_speedup(data, population_size=200, genome_length=50, worker_counts=(1, 2, 4), seed=0):
+    from genetic_algorithm import eval_func, get_initial_state
+
+    rng = random.Random(seed)
+    def random_population(size):
+        return [[rng.choice(['up', 'down', 'left', 'right']) for _ in range(genome_length)] for _ in range(size)]
+    population = random_population(population_size)
+    warm_up = random_population(max(worker_counts))
+
+    sim_cache = SimulationCache(get_initial_state(data))
+    for individual in warm_up:
+        eval_func(individual, data, sim_cache)
+    start = time.perf_counter()
+    expected = [eval_func(individual, data, sim_cache) for individual in population]
+    serial = time.perf_counter() - start
+
+    report = {}
+    for workers in worker_counts:
+        with ParallelEvaluator(data, workers) as evaluator:
+            evaluator.evaluate(warm_up[:workers])  # start the workers
+            start = time.perf_counter()
+            pop_fit = evaluator.evaluate(population)
+            elapsed = time.perf_counter() - start
+        assert pop_fit == expected, "parallel evaluation disagrees with the serial path"
+        report[workers] = (elapsed, serial / elapsed)
+        print(f"{workers} workers: {elapsed:.3f}s, speedup {serial / elapsed:.2f}x")
+    return report
@@ -0,0 +1,175 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from metrics import Metrics, MetricsRecorder
+from simulated_annealing import cached_eval, eval_func, get_initial_solution, get_random_neigh, is_optimum
+from transposition import TranspositionTable
+
+@dataclass
+class PTResult:
+    NumEvaluations: int
+    Cost: float
+    temperatures: list
+    rounds: int
+    swaps_attempted: int
+    swaps_accepted: int
+    best_state: any
+    F: list  # global best cost after each round
+    metrics: Metrics = None
+    shares: int = 0  # restarts of the coldest replica from the global best
+
+# One replica: a Metropolis chain at whatever temperature the main process
+# gives it each round. It runs in its own process and keeps its current
+# state, its best state and its own transposition table between rounds. A
+# round can also bring a (state, cost) to restart the chain from.
+def _replica(conn, data, seed):
+    random.seed(seed)
+    table = TranspositionTable()
+    u = get_initial_solution(data)
+    fu = cached_eval(u, table)
+    best_cost = fu
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        T, steps, restart = message
+        if restart is not None:
+            u, fu = restart
+            best_cost = min(best_cost, fu)
+        evaluations = 0
+        best = None
+        for _ in range(steps):
+            v = get_random_neigh(u)
+            if v is u:
+                continue  # no move possible from u
+            fv = cached_eval(v, table)
+            evaluations += 1
+            if fv < fu or random.random() < math.exp(-(fv - fu) / T):
+                u, fu = v, fv
+            if fu < best_cost:
+                best, best_cost = u, fu
+            if is_optimum(u):
+                best, best_cost = u, fu
+                break
+        # the best state only crosses the process boundary when it improved
+        conn.send((fu, best_cost, best, evaluations, is_optimum(u)))
+    conn.close()
+
+def _gone(process):
+    process.join(1)
+    return RuntimeError(f"replica process {process.pid} exited with code {process.exitcode}")
+
+# Reply of one replica. Polls instead of blocking on recv, so a replica
+# process that died (killed, out of memory) stops the run with an error
+# rather than leaving it waiting forever.
+def _receive(conn, process, poll_interval=1.0):
+    while not conn.poll(poll_interval):
+        if not process.is_alive():
+            raise _gone(process)
+    try:
+        return conn.recv()
+    except EOFError:
+        raise _gone(process) from None
+
+# Parallel tempering: one replica per temperature of a geometric ladder from
+# Tmin to Tmax, each in a worker process. Every round each replica runs steps
+# Metropolis steps, then neighbouring temperatures are offered a swap with
+# probability min(1, exp((1/Ti - 1/Tj) * (Ei - Ej))), alternating between even
+# and odd pairs. Replicas swap temperatures rather than states, so only costs
+# go back and forth, plus a replica's best state when it beats the global
+# best. The run stops when a replica solves the level, after max_rounds, or
+# when max_evaluations is reached.
+# share_interval: every this many rounds the replica at the coldest
+# temperature restarts from the global best state, when that is better than
+# its current state (None or 0 never shares it: the global best is then only
+# recorded, and the replicas go on from their own states)
+def parallel_tempering(data, replicas=None, Tmin=0.1, Tmax=20, steps=100, max_rounds=1000, max_evaluations=None,
+                       seed=None, profiler=None, share_interval=10):
+    replicas = replicas or os.cpu_count() or 1
+    if replicas > 1:
+        temperatures = [Tmin * (Tmax / Tmin) ** (i / (replicas - 1)) for i in range(replicas)]
+    else:
+        temperatures = [Tmin]
+    rng = random.Random(seed)
+    recorder = MetricsRecorder(['replicas', 'swaps'], profiler)
+
+    connections, processes = [], []
+    for i in range(replicas):
+        parent, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_replica, args=(child, data, rng.randrange(2 ** 32)))
+        process.start()
+        child.close()
+        connections.append(parent)
+        processes.append(process)
+
+    order = list(range(replicas))  # order[i] is the replica at temperatures[i]
+    costs = [None] * replicas
+    best_state = get_initial_solution(data)
+    best_cost = eval_func(best_state)
+    num_evaluations = 0
+    swaps_attempted = swaps_accepted = 0
+    shares = 0
+    F = []
+    rounds = 0
+    solved = False
+
+    try:
+        while rounds < max_rounds and not solved:
+            if max_evaluations is not None and num_evaluations >= max_evaluations:
+                break
+            rounds += 1
+            start = time.perf_counter()
+            coldest = order[0]
+            restart = None
+            if (share_interval and rounds % share_interval == 0 and costs[coldest] is not None
+                    and best_cost < costs[coldest]):
+                restart = (best_state, best_cost)
+                shares += 1
+            for position, replica in enumerate(order):
+                try:
+                    connections[replica].send((temperatures[position], steps, restart if replica == coldest else None))
+                except OSError:
+                    raise _gone(processes[replica]) from None
+            for replica, conn in enumerate(connections):
+                cost, replica_best, state, evaluations, done = _receive(conn, processes[replica])
+                costs[replica] = cost
+                num_evaluations += evaluations
+                if state is not None and (replica_best < best_cost or done):
+                    best_state, best_cost = state, replica_best
+                solved = solved or done
+            swapped = time.perf_counter()
+            recorder.timers['replicas'] += swapped - start
+
+            for i in range(rounds % 2, replicas - 1, 2):
+                a, b = order[i], order[i + 1]
+                swaps_attempted += 1
+                delta = (1 / temperatures[i] - 1 / temperatures[i + 1]) * (costs[a] - costs[b])
+                if delta >= 0 or rng.random() < math.exp(delta):
+                    order[i], order[i + 1] = b, a
+                    swaps_accepted += 1
+            recorder.timers['swaps'] += time.perf_counter() - swapped
+
+            F.append(best_cost)
+            print(f"Round {rounds}, best cost = {best_cost}, swaps accepted = {swaps_accepted}/{swaps_attempted}")
+    finally:
+        for conn in connections:
+            try:
+                conn.send(None)
+            except OSError:  # the replica is gone already
+                pass
+            conn.close()
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    metrics = recorder.finish(num_evaluations)
+    print(f"Final cost: {best_cost}")
+    print(f"Evaluations: {num_evaluations}")
+    return PTResult(num_evaluations, best_cost, temperatures, rounds, swaps_attempted, swaps_accepted,
+                    best_state, F, metrics, shares)
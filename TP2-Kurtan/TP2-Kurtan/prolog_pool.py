@@ -0,0 +1,230 @@
+import atexit
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+
+# Pool of SWI-Prolog engines for the A* (astar.pl) and IDS (IT.pl) programs.
+# pyswip embeds a single Prolog per process, and the two programs define some
+# of the same predicates, so every engine is a worker process that consults
+# one program once and then answers solve requests over a pipe. Results come
+# back as PrologResult instead of console output (the programs' own printing
+# is discarded).
+#
+#     with PrologPool(size=2) as pool:
+#         result = pool.solve('astar')
+#         results = pool.solve_all(['astar', 'ids', 'astar'])
+#
+# With saved_state=True an engine loads the quick-load file written by
+# save_states() (SWI-Prolog's qcompile) when it is newer than the source,
+# which skips parsing the program. The .pl files only know the bundled board.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROGRAMS = {'astar': 'astar.pl', 'ids': 'IT.pl'}
+QUERIES = {'astar': 'solve_astar(Moves, Expanded)', 'ids': 'solve_ids(Moves, Expanded)'}
+
+@dataclass
+class PrologResult:
+    solved: bool
+    moves: list
+    cost: int
+    expanded: int
+    time: float
+
+def source(program):
+    return os.path.join(HERE, PROGRAMS[program])
+
+def saved_state(program):
+    return os.path.splitext(source(program))[0] + '.qlf'
+
+def _load(program, use_saved_state):
+    state = saved_state(program)
+    if use_saved_state and os.path.exists(state) and os.path.getmtime(state) >= os.path.getmtime(source(program)):
+        return state
+    return source(program)
+
+def _quiet():
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+def _engine(conn, program, use_saved_state):
+    _quiet()
+    try:
+        from pyswip import Prolog
+        prolog = Prolog()
+        prolog.consult(_load(program, use_saved_state))
+    except Exception as e:
+        conn.send(repr(e))
+        return
+    conn.send(None)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:  # the pool's process is gone
+            break
+        if job is None:
+            break
+        start = time.perf_counter()
+        answer = list(prolog.query(QUERIES[program], maxresult=1))
+        elapsed = time.perf_counter() - start
+        if not answer or answer[0]['Moves'] == 'none':
+            expanded = answer[0]['Expanded'] if answer else 0
+            conn.send(PrologResult(False, [], None, expanded, elapsed))
+        else:
+            moves = [str(move) for move in answer[0]['Moves']]
+            cost = sum(1 for move in moves if move in ('up', 'down', 'left', 'right'))
+            conn.send(PrologResult(True, moves, cost, answer[0]['Expanded'], elapsed))
+    conn.close()
+
+# Engines are daemon processes, so they are stopped with the process that
+# started them even when it exits without closing its pool (atexit hooks do
+# not run in multiprocessing children, e.g. batch.py's level workers)
+class Engine:
+    def __init__(self, program, use_saved_state=False):
+        self.program = program
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_engine, args=(child, program, use_saved_state), daemon=True)
+        self.process.start()
+        child.close()
+        try:
+            error = self.conn.recv()
+        except EOFError:
+            error = f"exited with code {self.process.exitcode}"
+        if error is not None:
+            self.stop()
+            raise RuntimeError(f"the {program} Prolog engine did not start: {error}")
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+# Up to size engines per program, each started the first time a solve needs
+# it, so a pool only ever consults the programs it is asked to run. solve()
+# runs one query on an idle engine; solve_all() spreads a list of programs
+# over the engines and returns the results in the same order. An engine that
+# goes over timeout seconds, or dies, is killed and its result is None; the
+# next solve that needs it starts a new one.
+class PrologPool:
+    def __init__(self, size=1, programs=tuple(PROGRAMS), saved_state=False):
+        self.size = size
+        self.saved_state = saved_state
+        self.idle = {program: [] for program in programs}
+        self.started = dict.fromkeys(programs, 0)
+        self.solves = 0
+        self.restarts = 0
+
+    def engine(self, program):
+        if self.idle[program]:
+            return self.idle[program].pop()
+        if self.started[program] < self.size:
+            engine = Engine(program, self.saved_state)
+            self.started[program] += 1
+            return engine
+        return None
+
+    def solve(self, program, timeout=None):
+        return self.solve_all([program], timeout)[0]
+
+    def solve_all(self, programs, timeout=None):
+        for program in programs:
+            if program not in self.idle:
+                raise ValueError(f"program must be one of {', '.join(self.idle)}")
+        results = [None] * len(programs)
+        queue = list(enumerate(programs))
+        running = {}  # conn -> (engine, index, deadline)
+        while queue or running:
+            for index, program in list(queue):
+                engine = self.engine(program)
+                if engine is not None:
+                    engine.conn.send(True)
+                    deadline = time.monotonic() + timeout if timeout is not None else None
+                    running[engine.conn] = (engine, index, deadline)
+                    queue.remove((index, program))
+            deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+            wait_time = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+            for conn in wait(list(running), wait_time):
+                engine, index, _ = running.pop(conn)
+                try:
+                    results[index] = conn.recv()
+                    self.idle[engine.program].append(engine)
+                except EOFError:
+                    self.retire(engine)
+                self.solves += 1
+            now = time.monotonic()
+            for conn, (engine, index, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    del running[conn]
+                    self.retire(engine)
+        return results
+
+    def retire(self, engine):
+        engine.kill()
+        self.started[engine.program] -= 1
+        self.restarts += 1
+
+    def close(self):
+        for engines in self.idle.values():
+            for engine in engines:
+                engine.stop()
+            engines.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_default = None
+
+# Pool shared by the menu, cli.py and batch.py in this process, with one
+# engine per program started on first use. It stays warm for the life of the
+# process, e.g. across the requests of a service.py worker.
+def default_pool():
+    global _default
+    if _default is None:
+        _default = PrologPool()
+        atexit.register(_default.close)
+    return _default
+
+def _save_state(conn, program):
+    _quiet()
+    try:
+        from pyswip import Prolog
+        list(Prolog.query(f"qcompile('{source(program)}')"))
+        conn.send(None)
+    except Exception as e:
+        conn.send(repr(e))
+
+# Writes the quick-load file of each program next to its source, in a
+# separate process like the engines
+def save_states(programs=tuple(PROGRAMS)):
+    paths = []
+    for program in programs:
+        recv, send = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_save_state, args=(send, program))
+        process.start()
+        send.close()
+        try:
+            error = recv.recv()
+        except EOFError:
+            error = f"exited with code {process.exitcode}"
+        process.join()
+        if error is not None:
+            raise RuntimeError(f"could not save the {program} state: {error}")
+        paths.append(saved_state(program))
+    return paths
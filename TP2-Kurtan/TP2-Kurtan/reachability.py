@@ -0,0 +1,115 @@
+from collections import deque
+
+from tabuleiro import DIRECTIONS, GameState
+import tracing
+
+# Push-level view of a GameState. Walking around without touching a box, the
+# key or the gate never changes anything but the player cell, so the moves
+# worth choosing between are the macro moves: walk (along a shortest path) to
+# a cell next to a box and push it, or walk to the key or out of the gate.
+
+# Flood fill from the player over the cells it can walk to without changing
+# the state: no wall, box, gate or key in the way. Returns {cell: (previous
+# cell, direction)}, with the player cell mapped to None, in BFS order. The
+# smallest cell is kept on the state as its canonical region cell (see
+# GameState.canonical_key), so the push searches get it for free.
+def reachable(state: GameState):
+    layout = state.layout
+    neighbours = layout.neighbours
+    blocked = layout.walls | state.boxes
+    parents = {state.player: None}
+    queue = deque([state.player])
+    while queue:
+        cell = queue.popleft()
+        for d in range(4):
+            n = neighbours[d][cell]
+            if n < 0 or blocked >> n & 1 or n == layout.gate or n == state.key or n in parents:
+                continue
+            parents[n] = (cell, DIRECTIONS[d])
+            queue.append(n)
+    state.region = min(parents)
+    return parents
+
+# Shortest walk from the player to cell, as a list of directions
+def path_to(parents, cell):
+    path = []
+    while parents[cell] is not None:
+        cell, direction = parents[cell]
+        path.append(direction)
+    path.reverse()
+    return path
+
+# Every legal push from the reachable region, as (box cell, direction, path)
+# where path is the walk to the cell behind the box followed by the push
+def pushes(state: GameState, parents=None):
+    if state.game_over:
+        return []
+    layout = state.layout
+    neighbours = layout.neighbours
+    blocked = layout.walls | state.boxes
+    parents = reachable(state) if parents is None else parents
+    found = []
+    for cell in parents:
+        for d in range(4):
+            box = neighbours[d][cell]
+            if box < 0 or not state.boxes >> box & 1:
+                continue
+            dest = neighbours[d][box]
+            if dest < 0 or blocked >> dest & 1 or dest == layout.gate or dest == state.key:
+                continue
+            found.append((box, DIRECTIONS[d], path_to(parents, cell) + [DIRECTIONS[d]]))
+    return found
+
+# Every legal pull from the reachable region, as (cell, direction): the player
+# goes to cell, next to a box in that direction, and pulls it there (see
+# kurtan_utils.pull). Pulls undo pushes, so these are the moves of a search
+# run backwards from the solved box configuration.
+def pulls(state: GameState, parents=None):
+    layout = state.layout
+    neighbours = layout.neighbours
+    blocked = layout.walls | state.boxes
+    parents = reachable(state) if parents is None else parents
+    found = []
+    for cell in parents:
+        for d in range(4):
+            box = neighbours[d][cell]
+            if box < 0 or not state.boxes >> box & 1:
+                continue
+            back = neighbours[d ^ 1][cell]
+            if back < 0 or blocked >> back & 1 or back == layout.gate or back == state.key:
+                continue
+            found.append((cell, DIRECTIONS[d]))
+    return found
+
+# Paths of all macro moves: every push, plus picking up the key when it is out
+# and leaving through the gate once it is picked up (with every box placed)
+def macro_moves(state: GameState):
+    if state.game_over:
+        return []
+    layout = state.layout
+    parents = reachable(state)
+    paths = [path for _, _, path in pushes(state, parents)]
+    goals = []
+    if state.key_visible and state.key >= 0:
+        goals.append(state.key)
+    if state.key_picked and layout.gate >= 0 and state.check_all_boxes_on_targets():
+        goals.append(layout.gate)
+    for goal in goals:
+        # d ^ 1 is the opposite direction, so the goal is entered from that cell
+        approaches = [
+            path_to(parents, layout.neighbours[d ^ 1][goal]) + [DIRECTIONS[d]]
+            for d in range(4) if layout.neighbours[d ^ 1][goal] in parents
+        ]
+        if approaches:
+            paths.append(min(approaches, key=len))
+    tracing.counters['macro_moves'] += len(paths)
+    return paths
+
+# Replays a macro move on a copy of the state. The path comes from the
+# functions above, so every step is legal.
+def apply_macro(state: GameState, path):
+    child = state.clone()
+    tracing.counters['clones'] += 1
+    for direction in path:
+        child.move(direction)
+    return child
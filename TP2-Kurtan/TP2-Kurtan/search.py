@@ -0,0 +1,327 @@
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+
+from kurtan_utils import manhattan, pull
+from reachability import apply_macro, macro_moves, path_to, pulls, reachable
+from tabuleiro import DIRECTION_INDEX, DIRECTIONS, GameState
+from transposition import TranspositionTable
+import tracing
+
+@dataclass
+class SearchResult:
+    solved: bool
+    moves: list
+    cost: int
+    expanded: int
+    generated: int
+    max_open: int
+    time: float
+    iterations: int = 1
+
+# Admissible estimate of the moves left: every push moves one box by one cell,
+# and once the key is out the player still has to walk to it and to the gate
+def default_heuristic(state: GameState):
+    if state.game_over:
+        return 0
+    if state.layout.gate < 0:
+        return state.box_distance  # plain Sokoban level, no key or gate legs
+    if state.key_picked:
+        return manhattan(state.player_pos, state.gate_pos)
+    if state.key_visible:
+        return manhattan(state.player_pos, state.key_pos) + manhattan(state.key_pos, state.gate_pos)
+    return state.box_distance
+
+# Moves that leave a new box stuck lead to unsolvable states and are pruned
+def successors(state: GameState):
+    for direction in DIRECTIONS:
+        child = state.clone()
+        moved, _ = child.move(direction)
+        if moved and child.stuck_boxes <= state.stuck_boxes:
+            yield direction, child
+
+# Push-level successors: one child per macro move, labelled with its whole
+# path, so states differ in their boxes (or key and gate flags) from the parent
+def push_successors(state: GameState):
+    for path in macro_moves(state):
+        child = apply_macro(state, path)
+        if child.stuck_boxes <= state.stuck_boxes:
+            yield tuple(path), child
+
+# Backward successors: one child per pull, labelled (cell, direction). In the
+# child the box stands on cell, and pushing it in direction undoes the pull.
+def pull_successors(state: GameState):
+    for cell, direction in pulls(state):
+        yield (cell, direction), pull(state, direction, cell)
+
+def reconstruct(came_from, key):
+    moves = []
+    while came_from[key] is not None:
+        key, move = came_from[key]
+        if isinstance(move, tuple):
+            moves.extend(reversed(move))
+        else:
+            moves.append(move)
+    moves.reverse()
+    return moves
+
+# Canonical nodes stand for every player cell of their region, so a stored
+# macro path only holds from the cell the node was first reached at. The moves
+# are rebuilt from the start instead, taking the shortest macro move into each
+# node of the chain; the same pushes are open from anywhere in a region.
+def replay(state: GameState, came_from, key):
+    keys = []
+    while came_from[key] is not None:
+        keys.append(key)
+        key = came_from[key][0]
+    moves = []
+    for key in reversed(keys):
+        for path in sorted(macro_moves(state), key=len):
+            child = apply_macro(state, path)
+            if child.canonical_key() == key:
+                state = child
+                moves.extend(path)
+                break
+    return moves
+
+# A* over GameState with a binary heap as open list and a hashed closed set.
+# Among nodes with the same f the deepest one (largest g) is expanded first.
+# With pushes=True it expands macro moves (push_successors) instead of single
+# steps; g still counts steps, and since walks follow shortest paths the
+# solutions stay optimal while far fewer states are stored. canonical=True
+# also merges the push-level states that only differ by where the player
+# stands in its region (GameState.canonical_key), so there is one node per
+# box configuration and region. That is fewer nodes again, but a merged
+# state keeps the g of the cell it was reached at first, so the step count
+# is no longer guaranteed optimal.
+def astar(state: GameState = None, heuristic=default_heuristic, max_expansions=None, pushes=False,
+          canonical=False):
+    start_time = time.perf_counter()
+    state = state if state is not None else GameState()
+    if canonical and not pushes:
+        raise ValueError("canonical keys need pushes=True, single steps only move the player")
+    expand = push_successors if pushes else successors
+    state_key = GameState.canonical_key if canonical else GameState.state_key
+    counter = itertools.count()
+
+    start = state_key(state)
+    best_g = {start: 0}
+    came_from = {start: None}
+    open_list = [(heuristic(state), 0, next(counter), state)]
+    expanded = generated = 0
+    max_open = 1
+
+    while open_list:
+        _, neg_g, _, current = heapq.heappop(open_list)
+        g = -neg_g
+        key = state_key(current)
+        if g > best_g[key]:
+            continue  # stale entry, a cheaper path was found later
+
+        if current.is_goal_state():
+            if canonical:
+                moves = replay(state, came_from, key)
+                g = len(moves)
+            else:
+                moves = reconstruct(came_from, key)
+            return SearchResult(True, moves, g, expanded, generated, max_open, time.perf_counter() - start_time)
+
+        if max_expansions is not None and expanded >= max_expansions:
+            break
+        expanded += 1
+
+        for move, child in expand(current):
+            generated += 1
+            child_key = state_key(child)
+            child_g = g + (len(move) if pushes else 1)
+            if child_g < best_g.get(child_key, child_g + 1):
+                best_g[child_key] = child_g
+                came_from[child_key] = (key, move)
+                heapq.heappush(open_list, (child_g + heuristic(child), -child_g, next(counter), child))
+        max_open = max(max_open, len(open_list))
+
+    return SearchResult(False, [], None, expanded, generated, max_open, time.perf_counter() - start_time)
+
+FOUND = -1
+
+# IDA*: depth-first search bounded by f = g + h, with the bound raised to the
+# smallest f that exceeded it after each iteration. The current path is kept
+# in a set for O(1) cycle checks, and a size-capped transposition table keeps
+# the best g seen per state across iterations, so a state reached again with
+# the same or a worse g is not expanded twice.
+def ida_star(state: GameState = None, heuristic=default_heuristic, max_bound=None, table_size=1000000,
+             max_expansions=None):
+    start_time = time.perf_counter()
+    state = state if state is not None else GameState()
+    table = TranspositionTable(table_size)
+    path = []
+    path_keys = {state.state_key()}
+    stats = {'expanded': 0, 'generated': 0, 'iteration': 0}
+
+    def search(node, g, bound):
+        f = g + heuristic(node)
+        if f > bound:
+            return f
+        if node.is_goal_state():
+            return FOUND
+        if max_expansions is not None and stats['expanded'] >= max_expansions:
+            return float('inf')  # out of budget, ends the search unsolved
+        stats['expanded'] += 1
+        minimum = float('inf')
+        for move, child in successors(node):
+            stats['generated'] += 1
+            key = child.state_key()
+            if key in path_keys:
+                continue
+            seen = table.get(key)
+            if seen is not None and (seen[0] < g + 1 or seen == (g + 1, stats['iteration'])):
+                continue
+            table.put(key, (g + 1, stats['iteration']))
+
+            path.append(move)
+            path_keys.add(key)
+            t = search(child, g + 1, bound)
+            if t == FOUND:
+                return FOUND
+            minimum = min(minimum, t)
+            path.pop()
+            path_keys.remove(key)
+        return minimum
+
+    bound = heuristic(state)
+    while True:
+        stats['iteration'] += 1
+        t = search(state, 0, bound)
+        if tracing.level >= tracing.INFO:
+            tracing.emit('iteration', iteration=stats['iteration'], bound=bound, expanded=stats['expanded'],
+                         generated=stats['generated'])
+        if t == FOUND:
+            return SearchResult(True, list(path), len(path), stats['expanded'], stats['generated'],
+                                len(path), time.perf_counter() - start_time, stats['iteration'])
+        if t == float('inf') or (max_bound is not None and t > max_bound):
+            return SearchResult(False, [], None, stats['expanded'], stats['generated'],
+                                0, time.perf_counter() - start_time, stats['iteration'])
+        bound = t
+
+# Backward start nodes: every box on a target, with the player in each region
+# of the remaining floor. Returns the states and, for every floor cell, the
+# key of the start node whose region holds it.
+def goal_states(state: GameState):
+    layout = state.layout
+    if bin(state.boxes).count('1') != len(layout.target_cells):
+        raise ValueError("the backward search needs as many boxes as targets")
+    roots = []
+    regions = {}
+    for cell in layout.open_cells + layout.target_cells:
+        if cell in regions or layout.targets >> cell & 1:
+            continue
+        root = state.clone()
+        root.key, root.key_picked, root.key_visible, root.game_over = -1, False, False, False
+        root.boxes = layout.targets
+        root.player = cell
+        root.box_distance, root.stuck_boxes = root.heuristic_terms()
+        root.zhash = root.compute_hash()
+        root.region = -1
+        key = root.canonical_key()
+        regions.update(dict.fromkeys(reachable(root), key))
+        roots.append(root)
+    return roots, regions
+
+FORWARD, BACKWARD = 0, 1
+
+# Bidirectional breadth-first search over pushes. The forward side expands
+# push_successors from the start and the backward side pull_successors from
+# goal_states; both write to one hashed set of canonical_key nodes, and the
+# search stops as soon as one side generates a node the other side has seen.
+# Each round expands a whole layer of the smaller frontier, so a level that
+# needs d pushes is met after about 2*b^(d/2) nodes instead of b^d.
+#
+# The moves are the forward macro moves up to the meeting node, then the
+# backward pulls replayed as pushes (walking to each box along a shortest
+# path), then, on levels with a gate, an A* run for the walks to the key and
+# out of the gate. Few pushes is not the same as few steps, so the cost is
+# not always optimal. Only the box phase is searched from both sides: the
+# start state must still have the key hidden.
+def bidirectional(state: GameState = None, max_expansions=None):
+    start_time = time.perf_counter()
+    state = state if state is not None else GameState()
+    layout = state.layout
+    roots, regions = goal_states(state)
+
+    # key -> (side, parent key, move, state); forward states are kept for the
+    # replay, backward ones are only needed while they are in the frontier
+    start = state.canonical_key()
+    seen = {start: (FORWARD, None, None, state)}
+    for root in roots:
+        seen.setdefault(root.canonical_key(), (BACKWARD, None, None, None))
+    frontiers = [[state], roots]
+    expanded = generated = 0
+    max_open = len(roots) + 1
+    layers = 0
+
+    # moves from key back to its side's start, nearest first
+    def chain(key):
+        moves = []
+        while seen[key][1] is not None:
+            _, key, move, _ = seen[key]
+            moves.append(move)
+        return moves
+
+    # (state, forward macro paths up to it, backward moves from it to the goal)
+    meeting = (state, [], []) if state.check_all_boxes_on_targets() else None
+    while meeting is None and all(frontiers):
+        if max_expansions is not None and expanded >= max_expansions:
+            break
+        side = FORWARD if len(frontiers[FORWARD]) <= len(frontiers[BACKWARD]) else BACKWARD
+        expand = push_successors if side == FORWARD else pull_successors
+        layers += 1
+        frontier = []
+        for node in frontiers[side]:
+            if meeting is not None or (max_expansions is not None and expanded >= max_expansions):
+                break
+            expanded += 1
+            parent = node.canonical_key()
+            for move, child in expand(node):
+                generated += 1
+                if side == FORWARD and child.check_all_boxes_on_targets():
+                    # the key is out now, so the goal region is looked up by cell
+                    meeting = child, chain(parent)[::-1] + [move], chain(regions[child.player])
+                    break
+                key = child.canonical_key()
+                other = seen.get(key)
+                if other is None:
+                    seen[key] = (side, parent, move, child if side == FORWARD else None)
+                    frontier.append(child)
+                elif other[0] != side:
+                    if side == FORWARD:
+                        meeting = child, chain(parent)[::-1] + [move], chain(key)
+                    else:
+                        meeting = other[3], chain(key)[::-1], [move] + chain(parent)
+                    break
+        frontiers[side] = frontier
+        max_open = max(max_open, len(frontiers[FORWARD]) + len(frontiers[BACKWARD]))
+
+    if meeting is None:
+        return SearchResult(False, [], None, expanded, generated, max_open, time.perf_counter() - start_time,
+                            layers)
+
+    # each pull of the backward half becomes the push that undoes it
+    current, paths, pushes = meeting
+    moves = [direction for path in paths for direction in path]
+    for cell, direction in pushes:
+        behind = layout.neighbours[DIRECTION_INDEX[direction] ^ 1][cell]
+        path = path_to(reachable(current), behind) + [direction]
+        current = apply_macro(current, path)
+        moves.extend(path)
+
+    if not current.is_goal_state():
+        rest = astar(current)
+        if not rest.solved:
+            return SearchResult(False, [], None, expanded, generated, max_open, time.perf_counter() - start_time,
+                                layers)
+        expanded += rest.expanded
+        generated += rest.generated
+        moves.extend(rest.moves)
+    return SearchResult(True, moves, len(moves), expanded, generated, max_open, time.perf_counter() - start_time,
+                        layers)
@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+
+from batch import DEFAULT_OPTIONS, ENGINES, STOCHASTIC_ENGINES
+from level import Level, load_level
+
+# Long-running local solver service. Worker processes are started once, with
+# the engine modules already imported, and solve one level at a time; results
+# are kept in a SQLite file keyed by the level's canonical hash, the engine and
+# its settings, so a level that was solved before (under any name or in any
+# file format) is answered straight from the cache.
+#
+#     python service.py serve --workers 4 --cache results.sqlite
+#     python service.py solve levels.txt --level-index 2 --engine astar
+#
+# The protocol is one JSON object per line over a Unix socket (or localhost TCP
+# with --port). A request holds the level, either as 'level' (its lines, or one
+# string) or as 'path' and 'index', plus 'engine', 'max_evaluations',
+# 'time_limit' (seconds), 'options' (batch.py engine options), 'seed' and an
+# optional 'id' that is echoed back. The reply is a batch.py result row with
+# 'cached' added. {"op": "stats"} returns the cache and pool statistics.
+# Requests on one connection are answered as they finish, not in order.
+#
+# SA and GA requests without a seed are never cached or merged: each one is a
+# new random run, so one unlucky run must not answer all the later ones.
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'kurtan-solver.sock')
+DEFAULT_CACHE = 'solver_cache.sqlite'
+
+# Imported by every worker before its first job
+WARM_MODULES = ['simulated_annealing', 'genetic_algorithm', 'search', 'heuristics', 'reachability']
+
+# Rows worth keeping: errors and timeouts are tried again next time
+CACHED_STATUSES = {'solved', 'unsolved', 'skipped'}
+
+# The service calls it from one I/O thread, off the event loop
+class ResultCache:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, level_hash TEXT, engine TEXT, row TEXT, created REAL)"
+        )
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        found = self.db.execute("SELECT row FROM results WHERE key = ?", (key,)).fetchone()
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(found[0])
+
+    def put(self, key, level_hash, engine, row):
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                        (key, level_hash, engine, json.dumps(row), time.time()))
+        self.db.commit()
+
+    def stats(self):
+        size, = self.db.execute("SELECT COUNT(*) FROM results").fetchone()
+        return {'size': size, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.db.close()
+
+# Everything that can change a result goes into the key, the level name does not
+def request_key(level_hash, engine, max_evaluations, time_limit, options, seed):
+    settings = json.dumps([level_hash, engine, max_evaluations, time_limit, options, seed], sort_keys=True)
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()
+
+def _worker(conn):
+    from batch import solve_level
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        conn.send(solve_level(*job))
+    conn.close()
+
+class Worker:
+    def __init__(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker, args=(child,))
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+async def _readable(conn):
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(conn.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(conn.fileno())
+
+# Fixed set of warm workers. A job waits for an idle worker; a worker that goes
+# over the job's time limit, or dies, is replaced by a fresh one.
+class WorkerPool:
+    def __init__(self, size):
+        self.size = size
+        self.idle = asyncio.Queue()
+        for _ in range(size):
+            self.idle.put_nowait(Worker())
+        self.restarts = 0
+
+    async def run(self, job, time_limit=None):
+        worker = await self.idle.get()
+        engine, index, level = job[:3]
+        try:
+            worker.conn.send(job)
+            await asyncio.wait_for(_readable(worker.conn), time_limit)
+            return worker.conn.recv()
+        except asyncio.TimeoutError:
+            worker.kill()
+            worker = Worker()
+            self.restarts += 1
+            return {'index': index, 'level': level.name, 'engine': engine, 'status': 'timeout', 'solved': False,
+                    'time': time_limit}
+        except (EOFError, OSError):
+            worker.kill()
+            worker = Worker()
+            self.restarts += 1
+            return {'index': index, 'level': level.name, 'engine': engine, 'status': 'error', 'solved': False,
+                    'error': "worker exited"}
+        finally:
+            self.idle.put_nowait(worker)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().stop()
+
+def parse_level(request):
+    if 'level' in request:
+        lines = request['level']
+        if isinstance(lines, str):
+            lines = lines.splitlines()
+        return Level.parse([line for line in lines if line.strip()], request.get('name', ''), request.get('format'))
+    return load_level(request['path'], request.get('index', 0), request.get('format'))
+
+# Level files and the SQLite cache are read on a single I/O thread, so the
+# event loop keeps answering other requests meanwhile and the cache connection
+# is only ever used by one thread at a time.
+class SolverService:
+    def __init__(self, workers=None, cache_path=DEFAULT_CACHE):
+        self.pool = WorkerPool(workers or os.cpu_count() or 1)
+        self.io = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.cache = ResultCache(cache_path)
+        self.pending = {}  # key -> task of a solve in progress, shared by duplicate requests
+        self.requests = 0
+
+    async def in_io_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io, function, *args)
+
+    async def solve(self, request):
+        self.requests += 1
+        engine = request.get('engine', 'astar')
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+        level = await self.in_io_thread(parse_level, request)
+        options = {**DEFAULT_OPTIONS, **request.get('options', {})}
+        max_evaluations = request.get('max_evaluations')
+        time_limit = request.get('time_limit')
+        seed = request.get('seed')
+        job = (engine, 0, level, max_evaluations, options, seed)
+        if seed is None and engine in STOCHASTIC_ENGINES:
+            row = await self.pool.run(job, time_limit)
+            return {**row, 'cached': False}
+
+        level_hash = level.canonical_hash()
+        key = request_key(level_hash, engine, max_evaluations, time_limit, options, seed)
+        row = await self.in_io_thread(self.cache.get, key)
+        if row is not None:
+            return {**row, 'level': level.name, 'cached': True}
+        if key in self.pending:
+            row = await asyncio.shield(self.pending[key])
+            return {**row, 'level': level.name, 'cached': True}
+
+        task = asyncio.ensure_future(self.pool.run(job, time_limit))
+        self.pending[key] = task
+        try:
+            row = await asyncio.shield(task)
+        finally:
+            self.pending.pop(key, None)
+        if row['status'] in CACHED_STATUSES:
+            await self.in_io_thread(self.cache.put, key, level_hash, engine, row)
+        return {**row, 'cached': False}
+
+    async def stats(self):
+        return {'requests': self.requests, 'cache': await self.in_io_thread(self.cache.stats),
+                'workers': self.pool.size, 'in_progress': len(self.pending), 'worker_restarts': self.pool.restarts}
+
+    async def answer(self, line, writer, lock):
+        request = {}
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'stats':
+                reply = await self.stats()
+            else:
+                reply = await self.solve(request)
+        except Exception as e:
+            reply = {'status': 'error', 'solved': False, 'error': repr(e)}
+        if isinstance(request, dict) and 'id' in request:
+            reply = {'id': request['id'], **reply}
+        async with lock:
+            writer.write((json.dumps(reply) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.ensure_future(self.answer(line, writer, lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.pool.close()
+        self.io.shutdown()
+        self.cache.close()
+
+async def serve(path=DEFAULT_SOCKET, port=None, workers=None, cache_path=DEFAULT_CACHE):
+    service = SolverService(workers, cache_path)
+    if port is not None:
+        server = await asyncio.start_server(service.handle, '127.0.0.1', port)
+        where = f"127.0.0.1:{port}"
+    else:
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(service.handle, path)
+        where = path
+    print(f"Serving on {where} with {service.pool.size} workers, cache {cache_path}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        if port is None and os.path.exists(path):
+            os.unlink(path)
+
+# Blocking client for scripts: sends one request and returns the reply
+def request(payload, path=DEFAULT_SOCKET, port=None, timeout=None):
+    if port is not None:
+        sock = socket.create_connection(('127.0.0.1', port), timeout)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+    with sock, sock.makefile('rwb') as f:
+        f.write((json.dumps(payload) + '\n').encode('utf-8'))
+        f.flush()
+        return json.loads(f.readline())
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local solver service")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    common.add_argument('--port', type=int, help="use localhost TCP on this port instead of the socket")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_cmd = sub.add_parser('serve', parents=[common], help="run the service")
+    serve_cmd.add_argument('--workers', type=int, help="warm worker processes (default: CPU count)")
+    serve_cmd.add_argument('--cache', default=DEFAULT_CACHE, help="SQLite result cache")
+
+    solve_cmd = sub.add_parser('solve', parents=[common], help="send one level to a running service")
+    solve_cmd.add_argument('path', help="level collection file")
+    solve_cmd.add_argument('--level-index', type=int, default=0)
+    solve_cmd.add_argument('--level-format', choices=['sokoban', 'kurtan'])
+    solve_cmd.add_argument('--engine', choices=list(ENGINES), default='astar')
+    solve_cmd.add_argument('--max-evaluations', type=int)
+    solve_cmd.add_argument('--time-limit', type=float)
+    solve_cmd.add_argument('--seed', type=int)
+
+    sub.add_parser('stats', parents=[common], help="print the statistics of a running service")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.socket, args.port, args.workers, args.cache))
+        except KeyboardInterrupt:
+            pass
+        return None
+    if args.command == 'stats':
+        reply = request({'op': 'stats'}, args.socket, args.port)
+    else:
+        # the service reads the file itself, so the path is sent absolute
+        reply = request({'path': os.path.abspath(args.path), 'index': args.level_index, 'format': args.level_format,
+                         'engine': args.engine, 'max_evaluations': args.max_evaluations,
+                         'time_limit': args.time_limit, 'seed': args.seed}, args.socket, args.port)
+    print(json.dumps(reply))
+    return reply
+
+if __name__ == "__main__":
+    main()
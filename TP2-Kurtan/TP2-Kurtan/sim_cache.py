@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+from tabuleiro import GameState
+
+class TrieNode:
+    __slots__ = ('move', 'parent', 'children', 'state', 'real_moves', 'solved')
+
+    def __init__(self, move, parent, state, real_moves, solved):
+        self.move = move
+        self.parent = parent
+        self.children = {}
+        self.state = state
+        self.real_moves = real_moves
+        self.solved = solved
+
+# Prefix trie of simulated move sequences. Each node keeps the state reached
+# after its prefix, so an individual that shares a prefix with one simulated
+# before only replays the moves after it.
+#
+# Nodes are kept in LRU order and a path is always touched from the leaf up to
+# the root, so a node is never older than any of its descendants and the oldest
+# node is always a leaf that can be dropped on its own.
+#
+# extend() copies the state it stores; the caller adds those copies to
+# tracing.counters['clones'] (eval_func does it once per individual).
+class SimulationCache:
+    def __init__(self, initial_state: GameState, max_nodes=100000):
+        self.root = TrieNode(None, None, initial_state.clone(), 0, initial_state.is_goal_state())
+        self.max_nodes = max_nodes
+        self.nodes = OrderedDict()
+        self.reused_moves = 0
+        self.simulated_moves = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # Deepest cached node along moves and the number of moves it covers
+    def longest_prefix(self, moves):
+        node = self.root
+        depth = 0
+        for move in moves:
+            if node.solved:
+                break
+            child = node.children.get(move)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        self.reused_moves += depth
+        return node, depth
+
+    def extend(self, node: TrieNode, move, state: GameState, real_moves, solved):
+        child = TrieNode(move, node, state.clone(), real_moves, solved)
+        node.children[move] = child
+        self.nodes[child] = None
+        self.simulated_moves += 1
+        return child
+
+    # Marks the path ending in node as recently used and evicts old leaves
+    def touch(self, node: TrieNode):
+        while node is not self.root:
+            self.nodes.move_to_end(node)
+            node = node.parent
+        while len(self.nodes) > self.max_nodes:
+            leaf, _ = self.nodes.popitem(last=False)
+            del leaf.parent.children[leaf.move]
+
+    @property
+    def reuse_rate(self):
+        total = self.reused_moves + self.simulated_moves
+        return self.reused_moves / total if total else 0.0
@@ -1,15 +1,22 @@
 import random
 import math
+import time
 from dataclasses import dataclass
-import matplotlib.pyplot as plt
 from kurtan_utils import (
-    apply_pull, find_gate_position, find_key_position, is_box_stuck
+    apply_pull, is_box_stuck
 )
 from tabuleiro import (
     GameState, TARGET_POSITIONS,
     EMPTY, TARGET, PLAYER, BOX_ON_TARGET, BOX, WALL, GATE, KEY,
     direction_to_delta
 )
+from transposition import TranspositionTable
+from metrics import Metrics, MetricsRecorder
+from reachability import apply_macro, macro_moves
+from heuristics import box_term
+from cooling import make_schedule
+from anytime import ActiveTimer, Snapshot, finish
+import tracing
 
 @dataclass
 class SAResult:
@@ -23,25 +30,117 @@ class SAResult:
     best_state: any
     F: list
     final_solution: any
+    metrics: Metrics = None
+    reheats: int = 0
+    stop: str = None  # 'optimum', 'temperature', 'evaluations' or 'time'
 
-def simulated_annealing(Tmax, Tmin, R, k, data, sense='minimize'):
-    t = 0
+# plot: None for no plot, 'show' to open a window or a file name to save it
+# max_evaluations: stop once this many states were evaluated (None for no limit)
+# max_time: stop after this many seconds of search (None for no limit)
+# profiler: optional metrics.SamplingProfiler (or anything with start/stop) run
+# around the search, its report ends up in result.metrics.profile
+# neighbourhood: 'step' moves the player one cell, 'push' makes a macro move
+# (walk to a box and push it, or to the key or the gate)
+# heuristic: box term of eval_func, 'manhattan' or 'assignment' (heuristics.py)
+# schedule: cooling schedule of cooling.py, 'exponential' (T = Tmax*exp(-R*t)),
+# 'adaptive' (on the acceptance rate) or 'lundy-mees'
+# stagnation: after this many temperatures without a new best cost the run
+# reheats to reheat * Tmax, at most max_reheats times, starting again from
+# the best state when restart is True (None never reheats)
+# timed: time the neighbour and evaluation phases into result.metrics.timers.
+# Off by default, the clock reads around every neighbour cost more than the
+# cached evaluations they measure; a run with a profiler is always timed.
+def simulated_annealing(Tmax, Tmin, R, k, data, sense='minimize', table=None, plot=None, max_evaluations=None,
+                        profiler=None, neighbourhood='step', heuristic='manhattan', schedule='exponential',
+                        stagnation=None, reheat=0.5, max_reheats=3, restart=False, max_time=None, timed=False):
+    result = finish(iter_simulated_annealing(
+        Tmax, Tmin, R, k, data, sense, table, max_evaluations, profiler, neighbourhood, heuristic, schedule,
+        stagnation, reheat, max_reheats, restart, max_time, timed, stride=None
+    ))
+    table = result.metrics.caches['transposition']
+
+    print(f"Final cost: {result.Cost}")
+    print(f"Evaluations: {result.NumEvaluations}")
+    print(f"Cache hit rate: {table['hit_rate']:.2%} ({table['hits']} hits, {table['misses']} misses)")
+    if plot:
+        plot_cost_evolution(result.F, plot)
+
+    print("Final solution:")
+    result.best_state.print_board()
+    return result
+
+# Anytime SA (see anytime.py): a generator with the arguments of
+# simulated_annealing that yields a Snapshot every stride evaluations (only
+# the final one when stride is None). max_time counts the time spent
+# searching, not the pauses between snapshots.
+def iter_simulated_annealing(Tmax, Tmin, R, k, data, sense='minimize', table=None, max_evaluations=None,
+                             profiler=None, neighbourhood='step', heuristic='manhattan', schedule='exponential',
+                             stagnation=None, reheat=0.5, max_reheats=3, restart=False, max_time=None, timed=False,
+                             stride=100):
+    if neighbourhood not in ('step', 'push'):
+        raise ValueError("neighbourhood must be 'step' or 'push'")
+    if heuristic not in ('manhattan', 'assignment'):
+        raise ValueError("heuristic must be 'manhattan' or 'assignment'")
+    cooling = make_schedule(schedule, Tmax, Tmin, R)
+    return _simulated_annealing(Tmax, Tmin, R, k, data, sense, table, max_evaluations, profiler, neighbourhood,
+                                heuristic, cooling, stagnation, reheat, max_reheats, restart, max_time,
+                                timed or profiler is not None, stride)
+
+def _simulated_annealing(Tmax, Tmin, R, k, data, sense, table, max_evaluations, profiler, neighbourhood, heuristic,
+                         cooling, stagnation, reheat, max_reheats, restart, max_time, timed, stride):
+    get_neigh = get_random_push_neigh if neighbourhood == 'push' else get_random_neigh
+    if table is None:
+        table = TranspositionTable()
+    recorder = MetricsRecorder(['neighbour', 'evaluation'], profiler)
+    timer = ActiveTimer()
+    neighbour_time = evaluation_time = 0.0
     T = Tmax
     num_evaluations = 0
     found_optimum = False
+    stop = None
+    reheats = 0
+    stagnant = 0
 
     u = get_initial_solution(data)
-    fu = eval_func(u)
+    fu = cached_eval(u, table, heuristic)
     num_evaluations += 1
+    best, f_best = u, fu
     F = [fu]
+    next_snapshot = stride
 
-    while not found_optimum:
+    while stop is None:
         i = 0
-        while i < k and not found_optimum:
-            v = get_random_neigh(u)
-            if( v == u ): continue
-            fv = eval_func(v)
+        accepted = tried = 0
+        improved = False
+        while i < k:
+            if max_evaluations is not None and num_evaluations >= max_evaluations:
+                stop = 'evaluations'
+                break
+            if next_snapshot is not None and num_evaluations >= next_snapshot:
+                next_snapshot += stride
+                yield Snapshot(f_best, best, num_evaluations, timer.pause())
+                timer.resume()
+            if max_time is not None and timer.elapsed() >= max_time:
+                stop = 'time'
+                break
+            if timed:
+                start = time.perf_counter()
+                v = get_neigh(u)
+                generated = time.perf_counter()
+                neighbour_time += generated - start
+            else:
+                v = get_neigh(u)
+            i += 1
+            if v is u:
+                # no move possible: the player is shut in by walls and boxes
+                # it cannot push. Rare now that the gate only opens on a solved
+                # level, but the iteration still counts so the schedule ends.
+                continue
+            fv = cached_eval(v, table, heuristic)
+            if timed:
+                evaluation_time += time.perf_counter() - generated
             num_evaluations += 1
+            tried += 1
 
             dif = fv - fu
             if sense == 'maximize':
@@ -50,108 +149,141 @@ def simulated_annealing(Tmax, Tmin, R, k, data, sense='minimize'):
             if dif < 0:
                 u = v
                 fu = fv
+                accepted += 1
             else:
                 prob = math.exp(-dif / T) if fu != 0 else 0
                 if random.random() < prob:
                     u = v
                     fu = fv
+                    accepted += 1
 
             F.append(fu)
+            if (fu < f_best) if sense == 'minimize' else (fu > f_best):
+                best, f_best = u, fu
+                improved = True
 
             if is_optimum(u):
+                best, f_best = u, fu
                 found_optimum = True
+                stop = 'optimum'
+                break
 
-            i += 1
-
-        t += 1
-        T = Tmax * math.exp(-R * t)
-        if T < Tmin:
+        if stop is not None:
             break
+        T = cooling.next(accepted / tried if tried else 0.0)
+        if tracing.level >= tracing.INFO:
+            tracing.emit('temperature', T=T, cost=fu, best=f_best, accepted=accepted, tried=tried,
+                         evaluations=num_evaluations)
+        stagnant = 0 if improved else stagnant + 1
+        if stagnation is not None and stagnant >= stagnation and reheats < max_reheats:
+            reheats += 1
+            stagnant = 0
+            T = reheat * Tmax
+            cooling.reheat(T)
+            if restart:
+                u, fu = best, f_best
+            print(f"Reheat {reheats}: T = {T:.4g}, best cost = {f_best}")
+        elif T < Tmin:
+            stop = 'temperature'
 
-    print(f"Final cost: {fu}")
-    print(f"Evaluations: {num_evaluations}")
+    recorder.timers.update(neighbour=neighbour_time, evaluation=evaluation_time)
+    metrics = recorder.finish(num_evaluations, {'transposition': table.stats()})
+    result = SAResult(T, num_evaluations, f_best, Tmax, Tmin, R, k, best, F, u, metrics, reheats, stop)
+    yield Snapshot(f_best, best, num_evaluations, timer.pause(), True, result)
+
+def plot_cost_evolution(F, plot):
+    import matplotlib.pyplot as plt
+    plt.figure()
     plt.plot(F)
     plt.title("SA Cost Evolution")
     plt.xlabel("Iterations")
     plt.ylabel("Cost")
-    plt.show()
-
-    print("Final solution:")
-    u.print_board()
-    return SAResult(T, num_evaluations, fu, Tmax, Tmin, R, k, u, F, u)
+    if plot == 'show':
+        plt.show()
+    else:
+        plt.savefig(plot)
+        plt.close()
 
 # Simulated Annealing Utitilities functions
 DIRECTIONS = ['up', 'down', 'left', 'right']
 
 def get_initial_solution(data):
-    return GameState()
+    return data['state'].clone() if 'state' in data else GameState()
 
 def get_random_neigh(state: GameState):
-    for _ in range(10):
+    counters = tracing.counters
+    for attempt in range(10):
         new_state = state.clone()
         directions = DIRECTIONS.copy()
         random.shuffle(directions)
         for direction in directions:
+            boxes = new_state.boxes
             moved, _ = new_state.move(direction)
-            print("----------------------------------")
-            print("After moving:", direction)
-            new_state.print_board()
-            print("Player position:", new_state.player_pos)
+            if tracing.level >= tracing.DEBUG:
+                tracing.emit('move', direction=direction, moved=moved,
+                             player=new_state.player_pos, board=new_state.board)
             if moved:
+                counters['clones'] += attempt + 1
+                counters['moves'] += 1
+                if new_state.boxes != boxes:
+                    counters['pushes'] += 1
                 #caixa presa
                 box_stuck = is_box_stuck(new_state, direction)
                 if box_stuck:
-                    print("Box stuck. before pull.")
                     pulled = apply_pull(new_state, direction)
-                    print("----------------------------------")
                     if pulled:
+                        pulled.reveal_key()  # a pull bypasses move()
                         return pulled
                 return new_state
+    counters['clones'] += 10
     return state
 
-def eval_func(state: GameState):
-    board = state.board
+# Push-level neighbour, with the same pull rule as get_random_neigh. When no
+# macro move is left (all boxes blocked) it falls back to a single step, which
+# is what lets the pull rule free a blocked box. A pull bypasses move(), so
+# the key is revealed here, as in get_random_neigh, when it put the last box
+# on a target.
+def get_random_push_neigh(state: GameState):
+    paths = macro_moves(state)
+    if not paths:
+        return get_random_neigh(state)
+    path = random.choice(paths)
+    new_state = apply_macro(state, path)
+    if is_box_stuck(new_state, path[-1]):
+        pulled = apply_pull(new_state, path[-1])
+        if pulled:
+            pulled.reveal_key()
+            new_state = pulled
+    return new_state
+
+def eval_func(state: GameState, heuristic='manhattan'):
     total_distance = 0
     penalty = 0
-    box_positions = []
-    if not state.key_visible:
-        for i, row in enumerate(board):
-            for j, cell in enumerate(row):
-                if cell in [BOX, BOX_ON_TARGET]:
-                    box_positions.append((i, j))
-
-        for (bx, by) in box_positions:
-            if (bx, by) not in TARGET_POSITIONS:
-                distances = [abs(bx - gx) + abs(by - gy) for (gx, gy) in TARGET_POSITIONS]
-                if distances:
-                    total_distance += min(distances)
-
-            # Penalise stuck boxes
-            blocked_sides = 0
-            for dx, dy in [(-1,0), (1,0), (0,-1), (0,1)]:
-                nx, ny = bx + dx, by + dy
-                if not state.is_within_bounds(nx, ny):
-                    blocked_sides += 1
-                else:
-                    neighbor = state.cell_at(nx, ny)
-                    if neighbor in [WALL, BOX, BOX_ON_TARGET]:
-                        blocked_sides += 1
-            if blocked_sides >= 3:
-                penalty += 20
-
-     # 2. Penalise if the key is visible but not picked
-    if state.key_visible and not state.key_picked:
-        key_pos = find_key_position(board)
+    # 1. Distance of the boxes to the targets and stuck boxes, both kept up to
+    # date by GameState on every push (or the pushes of the assignment bound).
+    # A box pushed off its target after the key showed up counts again.
+    if state.key_visible and state.check_all_boxes_on_targets():
+        placed = True
+    else:
+        total_distance = box_term(state) if heuristic == 'assignment' else state.box_distance
+        penalty += 20 * state.stuck_boxes
+        placed = total_distance == 0 and state.check_all_boxes_on_targets()
+
+     # 2. Penalise if the key is out (or due, all boxes placed) but not picked.
+     # Levels without a gate are solved once the boxes are placed.
+    if (state.key_visible or placed) and not state.key_picked and state.layout.gate >= 0:
+        penalty += 10
+        key_pos = state.key_pos
         if key_pos:
             px, py = state.player_pos
             kx, ky = key_pos
             dist_to_key = abs(px - kx) + abs(py - ky)
-            penalty += 10 + dist_to_key
+            penalty += dist_to_key
 
     # 3. Penalise if it has the key already but did not leave yet
     if state.key_picked and not state.game_over:
         # Find gate
-        gate_pos = find_gate_position(board)
+        gate_pos = state.gate_pos
         if gate_pos:
             px, py = state.player_pos
             gx, gy = gate_pos
@@ -162,8 +294,16 @@ def eval_func(state: GameState):
 
 
 
+# Looks the state up in the transposition table before evaluating it
+def cached_eval(state: GameState, table: TranspositionTable, heuristic='manhattan'):
+    cost = table.get(state.zhash)
+    if cost is None:
+        cost = eval_func(state, heuristic)
+        table.put(state.zhash, cost)
+    return cost
+
 def is_optimum(state: GameState):
-    return state.key_picked and state.game_over
+    return state.is_goal_state()
 
 # Run the simulated annealing algorithm
 def run_simulated_annealing():
@@ -172,4 +312,15 @@ def run_simulated_annealing():
     Tmin = 0.001
     R = 0.01
     k = 10
-    simulated_annealing(Tmax, Tmin, R, k, data={})
\ No newline at end of file
+    simulated_annealing(Tmax, Tmin, R, k, data={}, plot='show')
+
+# Run parallel tempering, one replica per core
+def run_parallel_tempering():
+    from parallel_tempering import parallel_tempering
+    print("Parallel Tempering (Python) selected.")
+    result = parallel_tempering(data={})
+    print(f"Replicas: {len(result.temperatures)}, rounds: {result.rounds}, "
+          f"swaps accepted: {result.swaps_accepted}/{result.swaps_attempted}")
+    print("Final solution:")
+    result.best_state.print_board()
+    return result
\ No newline at end of file
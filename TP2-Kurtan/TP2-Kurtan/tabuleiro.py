@@ -1,4 +1,4 @@
-from copy import deepcopy
+import random
 
 WALL = 'X'
 PLAYER = 'P'
@@ -8,18 +8,154 @@ TARGET = '*'
 GATE = 'G'
 KEY = 'K'
 EMPTY = ' '
+WINNER = '♛'
 
 TARGET_POSITIONS = [(1, 3), (1, 5), (2, 4)]
 
+# Set to True to recompute the heuristic terms and the Zobrist hash from
+# scratch after every move and assert they match the incremental ones
+CHECK_INCREMENTAL = False
+
+# Fixed seed so the same level hashes the same way in every process
+ZOBRIST_SEED = 20250317
+
+DIRECTIONS = ['up', 'down', 'left', 'right']
+DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+# Directions along the vertical and the horizontal axis
+AXES = ((0, 1), (2, 3))
+
+# Static part of a board. It is built once per level and shared (never copied)
+# by every GameState: cells are indexed row-major (x * cols + y) and walls and
+# targets are kept as int bitsets.
+class Layout:
+    __slots__ = ('rows', 'cols', 'walls', 'targets', 'target_cells', 'gate',
+                 'open_cells', 'neighbours', 'target_distance', 'dead', 'axis_blocked',
+                 'zobrist_box', 'zobrist_player', 'zobrist_key', 'zobrist_flags')
+
+    def __init__(self, rows, cols, walls, targets, gate):
+        self.rows = rows
+        self.cols = cols
+        self.walls = walls
+        self.targets = targets
+        self.target_cells = tuple(i for i in range(rows * cols) if targets >> i & 1)
+        self.gate = gate
+        # Cells where the key may appear (the ' ' cells of the original board)
+        self.open_cells = tuple(
+            i for i in range(rows * cols)
+            if not (walls | targets) >> i & 1 and i != gate
+        )
+        # neighbours[d][i] is the cell next to i in direction d, or -1
+        self.neighbours = tuple(
+            tuple(self._neighbour(i, dx, dy) for i in range(rows * cols))
+            for dx, dy in map(direction_to_delta, DIRECTIONS)
+        )
+        # Manhattan distance from each cell to the nearest target
+        self.target_distance = tuple(
+            min((abs(x - tx) + abs(y - ty) for tx, ty in map(self.position, self.target_cells)), default=0)
+            for x, y in map(self.position, range(rows * cols))
+        )
+        self.dead = self._dead_squares()
+        # axis_blocked[a] has the cells where a box can never be pushed along
+        # axis a: a wall (or the gate) on either side, or dead squares on both
+        self.axis_blocked = tuple(
+            sum(1 << i for i in range(rows * cols) if self._blocked_on_axis(i, axis))
+            for axis in AXES
+        )
+        # Random 64 bit keys for every box cell, player cell, key cell and for
+        # the key_picked, key_visible and game_over flags
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_box = tuple(rng.getrandbits(64) for _ in range(rows * cols))
+        self.zobrist_player = tuple(rng.getrandbits(64) for _ in range(rows * cols))
+        self.zobrist_key = tuple(rng.getrandbits(64) for _ in range(rows * cols))
+        self.zobrist_flags = tuple(rng.getrandbits(64) for _ in range(3))
+
+    # Boxes can never stand on walls or on the gate, nor leave the board
+    def is_solid(self, i):
+        return i < 0 or self.walls >> i & 1 or i == self.gate
+
+    # Cells from which a box can never reach a target. Every cell a box can be
+    # pulled to, starting from the targets, is live; the remaining floor is dead.
+    def _dead_squares(self):
+        live = set(self.target_cells)
+        stack = list(self.target_cells)
+        while stack:
+            box = stack.pop()
+            for d in range(4):
+                player = self.neighbours[d][box]
+                if self.is_solid(player) or self.is_solid(self.neighbours[d][player]):
+                    continue
+                if player not in live:
+                    live.add(player)
+                    stack.append(player)
+        return sum(1 << i for i in range(self.rows * self.cols) if not self.is_solid(i) and i not in live)
+
+    def _blocked_on_axis(self, i, axis):
+        a, b = (self.neighbours[d][i] for d in axis)
+        if self.is_solid(a) or self.is_solid(b):
+            return True
+        return bool(self.dead >> a & 1 and self.dead >> b & 1)
+
+    def _neighbour(self, i, dx, dy):
+        x, y = divmod(i, self.cols)
+        x, y = x + dx, y + dy
+        if 0 <= x < self.rows and 0 <= y < self.cols:
+            return x * self.cols + y
+        return -1
+
+    def index(self, x, y):
+        return x * self.cols + y
+
+    def position(self, i):
+        return divmod(i, self.cols)
+
+    @classmethod
+    def from_board(cls, board, targets=TARGET_POSITIONS):
+        rows, cols = len(board), len(board[0])
+        walls = 0
+        target_bits = 0
+        gate = -1
+        for i, row in enumerate(board):
+            for j, cell in enumerate(row):
+                bit = 1 << (i * cols + j)
+                if cell == WALL:
+                    walls |= bit
+                elif cell in [GATE, WINNER]:
+                    gate = i * cols + j
+        for x, y in targets:
+            target_bits |= 1 << (x * cols + y)
+        return cls(rows, cols, walls, target_bits, gate)
+
+
 class GameState:
-    def __init__(self, board=None, key_picked=False, key_visible=False, game_over=False):
-        self.board = board if board else self.initial_board()
+    __slots__ = ('layout', 'boxes', 'player', 'key', 'key_picked', 'key_visible', 'game_over',
+                 'box_distance', 'stuck_boxes', 'zhash', 'region')
+
+    # targets defaults to TARGET_POSITIONS, the targets of the bundled level.
+    # States of a level.Level pass its layout so they all share one.
+    def __init__(self, board=None, key_picked=False, key_visible=False, game_over=False, targets=None, layout=None):
+        board = board if board else self.initial_board()
+        self.layout = layout or Layout.from_board(board, TARGET_POSITIONS if targets is None else targets)
         self.key_picked = key_picked
         self.key_visible = key_visible
         self.game_over = game_over
-        self.player_pos = self.find_player()
+        self.boxes = 0
+        self.player = -1
+        self.key = -1
+        cols = self.layout.cols
+        for i, row in enumerate(board):
+            for j, cell in enumerate(row):
+                if cell in [BOX, BOX_ON_TARGET]:
+                    self.boxes |= 1 << (i * cols + j)
+                elif cell in [PLAYER, WINNER]:
+                    self.player = i * cols + j
+                elif cell == KEY:
+                    self.key = i * cols + j
+        self.box_distance, self.stuck_boxes = self.heuristic_terms()
+        self.zhash = self.compute_hash()
+        self.region = -1
 
-    def initial_board(self):
+    @staticmethod
+    def initial_board():
         return [
             ['X', 'X', 'X', 'X', 'X', 'X','X', 'X', 'X', 'X'],
             ['X', 'X', ' ', '*', ' ', '*','X', 'X', 'X', 'X'],
@@ -29,99 +165,256 @@ class GameState:
             ['X', 'X', 'X', 'X', 'X', 'X','X', 'X', 'X', 'X']
         ]
 
+    @property
+    def player_pos(self):
+        return self.layout.position(self.player) if self.player >= 0 else None
+
+    @player_pos.setter
+    def player_pos(self, pos):
+        self.update_board(self.layout.index(*pos))
+        self.region = -1
+
+    @property
+    def key_pos(self):
+        return self.layout.position(self.key) if self.key >= 0 else None
+
+    @property
+    def gate_pos(self):
+        return self.layout.position(self.layout.gate) if self.layout.gate >= 0 else None
+
+    # Rebuilt on demand, only meant for printing and debugging
+    @property
+    def board(self):
+        layout = self.layout
+        return [[self.cell_at(x, y) for y in range(layout.cols)] for x in range(layout.rows)]
+
+    # Exact identity of the dynamic part of the state, for closed sets
+    def state_key(self):
+        return (self.boxes, self.player, self.key, self.key_picked, self.key_visible, self.game_over)
+
+    # Identity up to walking: the player cell is replaced by the smallest cell
+    # of the region it can walk around in, so all the states that only differ
+    # by a walk share one key. Only meant for push-level searches, where walks
+    # are folded into the macro moves.
+    def canonical_key(self):
+        return (self.boxes, self.region_cell(), self.key, self.key_picked, self.key_visible, self.game_over)
+
+    # Smallest cell the player can walk to. Kept across plain walks, which stay
+    # in the region, and found again by a flood fill after anything else.
+    def region_cell(self):
+        if self.region < 0:
+            from reachability import reachable
+            reachable(self)
+        return self.region
+
     def find_player(self):
-        for i, row in enumerate(self.board):
-            for j, cell in enumerate(row):
-                if cell == PLAYER:
-                    return (i, j)
-        return None
+        return self.player_pos
+
+    def box_positions(self):
+        position = self.layout.position
+        boxes = self.boxes
+        return [position(i) for i in range(boxes.bit_length()) if boxes >> i & 1]
 
     def is_within_bounds(self, x, y):
-        return 0 <= x < len(self.board) and 0 <= y < len(self.board[0])
+        return 0 <= x < self.layout.rows and 0 <= y < self.layout.cols
 
     def cell_at(self, x, y):
-        return self.board[x][y] if self.is_within_bounds(x, y) else None
+        if not self.is_within_bounds(x, y):
+            return None
+        layout = self.layout
+        i = layout.index(x, y)
+        bit = 1 << i
+        if i == self.player:
+            return WINNER if self.game_over and i == layout.gate else PLAYER
+        if self.boxes & bit:
+            return BOX_ON_TARGET if layout.targets & bit else BOX
+        if layout.walls & bit:
+            return WALL
+        if i == layout.gate:
+            return GATE
+        if i == self.key:
+            return KEY
+        return TARGET if layout.targets & bit else EMPTY
 
     def cell_under(self, x, y):
-        return TARGET if (x, y) in TARGET_POSITIONS else EMPTY
+        return TARGET if self.layout.targets >> self.layout.index(x, y) & 1 else EMPTY
 
     def move(self, direction):
         if self.game_over:
             return False, "Game is over."
 
-        dx, dy = direction_to_delta(direction)
-        px, py = self.player_pos
-        nx, ny = px + dx, py + dy
+        layout = self.layout
+        n = layout.neighbours[DIRECTION_INDEX[direction]][self.player]
 
-        if not self.is_within_bounds(nx, ny):
+        if n < 0:
             return False, "Out of bounds."
 
-        target_cell = self.cell_at(nx, ny)
+        bit = 1 << n
 
-        if target_cell in [EMPTY, TARGET]:
-            self.update_board(px, py, nx, ny)
-        elif target_cell == GATE and self.key_picked:
-            self.update_board(px, py, nx, ny, win=True)
-            self.game_over = True
-        elif target_cell == KEY and self.key_visible:
-            self.key_picked = True
-            self.update_board(px, py, nx, ny)
-        elif target_cell in [BOX, BOX_ON_TARGET]:
-            if self.push_box(px, py, nx, ny, dx, dy, target_cell):
-                self.update_board(px, py, nx, ny)
+        if self.boxes & bit:
+            if self.push_box(n, DIRECTION_INDEX[direction]):
+                self.update_board(n)
             else:
                 return False, "Cannot push box."
-        else:
+        elif layout.walls & bit:
             return False, "Invalid movement."
+        elif n == layout.gate:
+            # the gate only opens with the key and every box still on a target,
+            # leaving with a box pushed off would end the game unsolved
+            if not self.key_picked or not self.check_all_boxes_on_targets():
+                return False, "Invalid movement."
+            self.update_board(n)
+            self.region = -1
+            self.game_over = True
+            self.zhash ^= layout.zobrist_flags[2]
+        elif n == self.key:
+            if not self.key_visible:
+                return False, "Invalid movement."
+            self.key_picked = True
+            self.zhash ^= layout.zobrist_flags[0] ^ layout.zobrist_key[n]
+            self.key = -1
+            self.update_board(n)
+            self.region = -1
+        else:
+            self.update_board(n)  # a plain walk stays in the region
 
-        if self.check_all_boxes_on_targets() and not self.key_visible:
-            self.key_visible = True
-            self.place_key()
+        if not self.key_visible:
+            self.reveal_key()
 
-        return True, "Moved."
+        if CHECK_INCREMENTAL:
+            self.check_incremental()
 
-    def update_board(self, px, py, nx, ny, win=False):
-        if (px, py) in TARGET_POSITIONS:
-            self.board[px][py] = TARGET
-        else:
-            self.board[px][py] = EMPTY
+        return True, "Moved."
 
-        self.board[nx][ny] = '♛' if win else PLAYER
-        self.player_pos = (nx, ny)
+    # The key shows up once every box is on a target
+    def reveal_key(self):
+        if not self.key_visible and self.check_all_boxes_on_targets():
+            self.key_visible = True
+            self.zhash ^= self.layout.zobrist_flags[1]
+            self.place_key()
 
-    def push_box(self, px, py, bx, by, dx, dy, box_type):
-        nx, ny = bx + dx, by + dy
-        if not self.is_within_bounds(nx, ny):
-            return False
+    def update_board(self, n):
+        zobrist_player = self.layout.zobrist_player
+        if self.player >= 0:
+            self.zhash ^= zobrist_player[self.player]
+        self.zhash ^= zobrist_player[n]
+        self.player = n
 
-        dest_cell = self.cell_at(nx, ny)
-        if dest_cell not in [EMPTY, TARGET]:
+    def push_box(self, b, d):
+        n = self.layout.neighbours[d][b]
+        if n < 0 or (self.layout.walls | self.boxes) >> n & 1 or n == self.layout.gate or n == self.key:
             return False
 
         # move box
-        self.board[nx][ny] = BOX_ON_TARGET if dest_cell == TARGET else BOX
-        self.board[bx][by] = TARGET if (bx, by) in TARGET_POSITIONS else EMPTY
+        self.move_box(b, n)
         return True
 
+    # Keeps box_distance and stuck_boxes up to date: only the box itself and the
+    # neighbours of the two cells it moved between can change their stuck status
+    def move_box(self, src, dst):
+        neighbours = self.layout.neighbours
+        touched = {src, dst}
+        for d in range(4):
+            touched.add(neighbours[d][src])
+            touched.add(neighbours[d][dst])
+        touched.discard(-1)
+
+        stuck = self.stuck_boxes - sum(1 for i in touched if self.is_stuck(i))
+        self.boxes ^= (1 << src) | (1 << dst)
+        self.stuck_boxes = stuck + sum(1 for i in touched if self.is_stuck(i))
+        self.box_distance += self.layout.target_distance[dst] - self.layout.target_distance[src]
+        self.zhash ^= self.layout.zobrist_box[src] ^ self.layout.zobrist_box[dst]
+        self.region = -1
+
+        if CHECK_INCREMENTAL:
+            self.check_incremental()
+
+    # A box off target is stuck when it sits on a dead square or is frozen, i.e.
+    # it cannot move along either axis. Both only look at the box neighbours.
+    def is_stuck(self, i):
+        layout = self.layout
+        if not self.boxes >> i & 1 or layout.targets >> i & 1:
+            return False
+        if layout.dead >> i & 1:
+            return True
+        return self.is_frozen_on_axis(i, 0) and self.is_frozen_on_axis(i, 1)
+
+    # Blocked by the level itself, or by a neighbouring box on the same axis
+    # that cannot move along the other axis
+    def is_frozen_on_axis(self, i, axis):
+        layout = self.layout
+        if layout.axis_blocked[axis] >> i & 1:
+            return True
+        other = layout.axis_blocked[1 - axis]
+        for d in AXES[axis]:
+            n = layout.neighbours[d][i]
+            if n >= 0 and self.boxes >> n & 1 and other >> n & 1:
+                return True
+        return False
+
+    # Full recomputation of the heuristic terms, used at construction time and
+    # to check the incremental updates
+    def heuristic_terms(self):
+        boxes = self.boxes
+        cells = [i for i in range(boxes.bit_length()) if boxes >> i & 1]
+        distance = sum(self.layout.target_distance[i] for i in cells)
+        stuck = sum(1 for i in cells if self.is_stuck(i))
+        return distance, stuck
+
+    def compute_hash(self):
+        layout = self.layout
+        h = 0
+        for i in range(self.boxes.bit_length()):
+            if self.boxes >> i & 1:
+                h ^= layout.zobrist_box[i]
+        if self.player >= 0:
+            h ^= layout.zobrist_player[self.player]
+        if self.key >= 0:
+            h ^= layout.zobrist_key[self.key]
+        for flag, key in zip((self.key_picked, self.key_visible, self.game_over), layout.zobrist_flags):
+            if flag:
+                h ^= key
+        return h
+
+    def check_incremental(self):
+        assert (self.box_distance, self.stuck_boxes) == self.heuristic_terms()
+        assert self.zhash == self.compute_hash()
+        if self.region >= 0:
+            from reachability import reachable
+            region = self.region
+            assert region == min(reachable(self))
+
     def check_all_boxes_on_targets(self):
-        for x, y in TARGET_POSITIONS:
-            if self.board[x][y] not in [BOX_ON_TARGET]:
-                return False
-        return True
+        targets = self.layout.targets
+        return self.boxes & targets == targets
 
     def place_key(self):
-        for i, row in enumerate(self.board):
-            for j, cell in enumerate(row):
-                if cell == EMPTY:
-                    self.board[i][j] = KEY
-                    return
-                
+        for i in self.layout.open_cells:
+            if i != self.player and not self.boxes >> i & 1:
+                self.key = i
+                self.zhash ^= self.layout.zobrist_key[i]
+                self.region = -1
+                return
+
+    # Levels without a gate (plain Sokoban) are won once every box is on a target
     def is_goal_state(self):
+        if self.layout.gate < 0:
+            return self.check_all_boxes_on_targets()
         return self.check_all_boxes_on_targets() and self.key_picked and self.game_over
 
     def clone(self):
-        new_state = GameState(deepcopy(self.board), self.key_picked, self.key_visible, self.game_over)
-        new_state.player_pos = self.player_pos
+        new_state = GameState.__new__(GameState)
+        new_state.layout = self.layout
+        new_state.boxes = self.boxes
+        new_state.player = self.player
+        new_state.key = self.key
+        new_state.key_picked = self.key_picked
+        new_state.key_visible = self.key_visible
+        new_state.game_over = self.game_over
+        new_state.box_distance = self.box_distance
+        new_state.stuck_boxes = self.stuck_boxes
+        new_state.zhash = self.zhash
+        new_state.region = self.region
         return new_state
 
     def print_board(self):
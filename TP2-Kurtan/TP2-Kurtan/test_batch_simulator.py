@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from batch_simulator import check_against_reference
+from level import iter_levels
+from tabuleiro import GameState
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.txt')
+
+def initial_states():
+    yield 'bundled', GameState()
+    for level in iter_levels(LEVELS):
+        yield level.name, level.initial_state()
+
+STATES = list(initial_states())
+
+# The NumPy backend has to end every individual in the same state, with the
+# same fitness, as GameState.move and genetic_algorithm.eval_func
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('name, initial', STATES, ids=[name for name, _ in STATES])
+def test_matches_reference_simulator(name, initial, seed):
+    data = {'N': 40, 'optimum': 0, 'board': initial.board, 'state': initial}
+    for genome_length in (40, 120):
+        assert check_against_reference(data, population_size=200, genome_length=genome_length, seed=seed)
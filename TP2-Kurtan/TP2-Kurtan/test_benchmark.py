@@ -0,0 +1,25 @@
+import pytest
+
+from benchmark import compare, summarise
+
+def results(rate, noise=None):
+    run = {'micro': {'moves_per_sec': rate}, 'macro': {'sa/bundled': {'solved': 1.0, 'time': 1.0}}}
+    if noise is not None:
+        run['noise'] = {'micro.moves_per_sec': noise, 'macro.sa/bundled.time': noise}
+    return run
+
+def regressions(baseline, current, threshold=0.1):
+    return [metric for metric, *_, regressed in compare(baseline, current, threshold) if regressed]
+
+def test_summarise_gives_median_and_half_spread():
+    assert summarise([90, 100, 130]) == (100, pytest.approx(0.2))
+
+def test_noise_widens_the_band():
+    assert regressions(results(100, 0.1), results(85, 0.05)) == []
+    assert regressions(results(100, 0.1), results(75, 0.05)) == ['micro.moves_per_sec']
+    # the larger noise of the two runs counts
+    assert regressions(results(100, 0.0), results(75, 0.2)) == []
+
+def test_baseline_without_noise_uses_the_threshold():
+    assert regressions(results(100), results(89)) == ['micro.moves_per_sec']
+    assert regressions(results(100), results(91)) == []
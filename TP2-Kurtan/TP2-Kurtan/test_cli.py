@@ -0,0 +1,14 @@
+import pytest
+
+from cli import main
+
+def test_ga_stops_at_max_evaluations(capsys):
+    result = main(['ga', '--seed', '1', '--max-evaluations', '300', '--format', 'json'])
+    assert result['evaluations'] <= 300
+
+@pytest.mark.parametrize('engine', ['astar', 'ids'])
+def test_prolog_rejects_a_level_file(engine, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main([engine, '--prolog', '--level', 'levels.txt'])
+    assert exit.value.code == 2
+    assert '--prolog only solves the bundled level' in capsys.readouterr().err
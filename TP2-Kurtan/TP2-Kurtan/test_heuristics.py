@@ -0,0 +1,49 @@
+import itertools
+import os
+import random
+
+import pytest
+
+from heuristics import UNREACHABLE, Assignment, push_distances
+from level import iter_levels
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.txt')
+
+def brute_force(distance, cells):
+    return min(sum(distance[t][cell] for t, cell in enumerate(order))
+               for order in itertools.permutations(cells, len(distance)))
+
+def mask(cells):
+    return sum(1 << cell for cell in cells)
+
+# Moves one box at a time and checks every incremental re-solve, each built on
+# the previous one, against the brute-force minimum and a full solve
+def check_moves(distance, free_cells, rng, moves=30):
+    cells = rng.sample(free_cells, len(distance))
+    solution = Assignment.solve(distance, mask(cells), list(cells))
+    assert solution.cost == brute_force(distance, cells)
+    for _ in range(moves):
+        src = rng.choice(cells)
+        dst = rng.choice([cell for cell in free_cells if cell not in cells])
+        cells[cells.index(src)] = dst
+        solution = solution.moved(distance, mask(cells), src, dst)
+        assert solution.cost == brute_force(distance, cells)
+        assert solution.cost == Assignment.solve(distance, mask(cells), list(cells)).cost
+
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5])
+def test_moved_matches_brute_force_on_random_costs(n):
+    rng = random.Random(n)
+    for _ in range(100):
+        size = n + rng.randrange(1, 6)
+        distance = [[rng.choice([UNREACHABLE] + list(range(20))) for _ in range(size)] for _ in range(n)]
+        check_moves(distance, list(range(size)), rng)
+
+@pytest.mark.parametrize('level', [level for level in iter_levels(LEVELS) if len(level.targets) > 1],
+                         ids=lambda level: level.name)
+def test_moved_matches_brute_force_on_levels(level):
+    layout = level.layout
+    distance = push_distances(layout)
+    free_cells = [i for i in range(layout.rows * layout.cols) if not layout.is_solid(i)]
+    rng = random.Random(0)
+    for _ in range(100):
+        check_moves(distance, free_cells, rng)
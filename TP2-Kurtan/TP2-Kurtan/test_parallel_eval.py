@@ -0,0 +1,25 @@
+import random
+
+import pytest
+
+from genetic_algorithm import eval_func
+from parallel_eval import ParallelEvaluator
+from tabuleiro import DIRECTIONS, GameState
+
+def population(seed, size=120, genome_length=40):
+    rng = random.Random(seed)
+    return [[rng.choice(DIRECTIONS) for _ in range(genome_length)] for _ in range(size)]
+
+# The workers keep their own prefix caches and get the population in chunks,
+# but the fitness list has to be the serial one, in the same order
+@pytest.mark.parametrize('workers, chunk_size', [(1, None), (2, None), (3, 7)])
+def test_parallel_fitness_matches_serial(workers, chunk_size):
+    state = GameState()
+    data = {'N': 40, 'optimum': 0, 'board': state.board, 'state': state}
+    individuals = population(0)
+    expected = [eval_func(individual, data) for individual in individuals]
+    with ParallelEvaluator(data, workers, chunk_size) as evaluator:
+        assert evaluator.evaluate(individuals) == expected
+        # a second generation goes through the warm worker caches
+        assert evaluator.evaluate(individuals[::-1]) == expected[::-1]
+        assert evaluator.evaluate([]) == []
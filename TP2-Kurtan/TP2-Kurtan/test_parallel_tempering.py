@@ -0,0 +1,27 @@
+import inspect
+import os
+
+import pytest
+
+import parallel_tempering
+from parallel_tempering import parallel_tempering as run_pt
+
+def test_global_best_is_shared_by_default():
+    interval = inspect.signature(run_pt).parameters['share_interval'].default
+    assert interval
+    # a warm coldest replica, so it is not always the one holding the best
+    result = run_pt({}, replicas=3, Tmin=2, steps=5, max_rounds=6 * interval, seed=0)
+    assert result.shares > 0
+
+def test_sharing_can_be_turned_off():
+    result = run_pt({}, replicas=3, Tmin=2, steps=5, max_rounds=60, seed=0, share_interval=0)
+    assert result.shares == 0
+
+def _dies(conn, data, seed):
+    os._exit(3)
+
+# A replica that dies stops the run with an error instead of a hang
+def test_dead_replica_raises(monkeypatch):
+    monkeypatch.setattr(parallel_tempering, '_replica', _dies)
+    with pytest.raises(RuntimeError, match='exited with code 3'):
+        run_pt({}, replicas=2, steps=10, max_rounds=5, seed=0)
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from prolog_pool import PrologPool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Stand-in for pyswip, so the pool and its process handling can be tested
+# without SWI-Prolog: every query answers with a fixed solution, after
+# STUB_PROLOG_SLEEP seconds
+STUB = '''
+import os
+import time
+
+class Prolog:
+    def consult(self, path):
+        self.path = path
+
+    def query(self, query, maxresult=-1):
+        time.sleep(float(os.environ.get('STUB_PROLOG_SLEEP', 0)))
+        return [{'Moves': ['up', 'left', 'left'], 'Expanded': 7}]
+'''
+
+@pytest.fixture
+def stub_pyswip(tmp_path, monkeypatch):
+    (tmp_path / 'pyswip').mkdir()
+    (tmp_path / 'pyswip' / '__init__.py').write_text(STUB)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'pyswip', raising=False)
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join([str(tmp_path), HERE]))
+    return tmp_path
+
+def test_pool_returns_moves_and_expansions(stub_pyswip):
+    with PrologPool() as pool:
+        result = pool.solve('astar')
+        assert pool.started == {'astar': 1, 'ids': 0}  # only the requested program is started
+    assert result.solved
+    assert result.moves == ['up', 'left', 'left']
+    assert result.cost == 3
+    assert result.expanded == 7
+
+def test_pool_retires_an_engine_over_the_timeout(stub_pyswip, monkeypatch):
+    monkeypatch.setenv('STUB_PROLOG_SLEEP', '30')
+    with PrologPool() as pool:
+        assert pool.solve('ids', timeout=0.5) is None
+        assert pool.restarts == 1
+        assert pool.started['ids'] == 0
+
+# The level workers of batch.py exit without running atexit hooks, so the
+# engines they start must not keep them (and batch.py) waiting
+def test_batch_prolog_engine_finishes(stub_pyswip):
+    done = subprocess.run(
+        [sys.executable, 'batch.py', 'levels.txt', '--engine', 'astar-prolog', '--workers', '1'],
+        cwd=HERE, capture_output=True, text=True, timeout=60,
+    )
+    assert done.returncode == 0, done.stderr
+    rows = [json.loads(line) for line in done.stdout.splitlines()]
+    statuses = {row['level']: row['status'] for row in rows}
+    assert statuses['bundled'] == 'solved'
+    assert set(statuses.values()) == {'solved', 'skipped'}
+    assert next(row for row in rows if row['level'] == 'bundled')['evaluations'] == 7
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from level import iter_levels
+from search import astar, bidirectional
+from tabuleiro import GameState
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.txt')
+
+def replays_to_goal(result):
+    state = GameState()
+    for move in result.moves:
+        moved, message = state.move(move)
+        assert moved, message
+    return state.is_goal_state() and len(result.moves) == result.cost
+
+# Step and push A* are optimal, 15 steps on the bundled level
+@pytest.mark.parametrize('pushes', [False, True])
+def test_astar_is_optimal(pushes):
+    result = astar(GameState(), pushes=pushes)
+    assert result.cost == 15
+    assert replays_to_goal(result)
+
+# Merging player cells per region (canonical=True) and the bidirectional
+# search trade the step count for fewer nodes: both find a 17-step solution
+def test_canonical_searches_are_not_optimal():
+    canonical = astar(GameState(), pushes=True, canonical=True)
+    both = bidirectional(GameState())
+    assert canonical.cost == both.cost == 17
+    assert replays_to_goal(canonical)
+    assert replays_to_goal(both)
+    assert canonical.expanded < astar(GameState(), pushes=True).expanded
+
+# The expansion counts quoted in the README for levels.txt
+BIDIRECTIONAL_EXPANSIONS = {
+    'bundled': (25, 71),
+    'corridor': (9, 4),
+    'two boxes': (11, 121),
+    'detour': (19, 6),
+    'sokoban (no gate)': (28, 83),
+}
+
+@pytest.mark.parametrize('level', list(iter_levels(LEVELS)), ids=lambda level: level.name)
+def test_bidirectional_expansions(level):
+    both = bidirectional(level.initial_state())
+    push = astar(level.initial_state(), pushes=True)
+    assert (both.expanded, push.expanded) == BIDIRECTIONAL_EXPANSIONS[level.name]
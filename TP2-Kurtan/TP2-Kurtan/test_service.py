@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from service import SolverService
+
+CORRIDOR = ['#######', '#@ $ .#', '#   G #', '#######']
+
+def solve_twice(tmp_path, request):
+    async def run():
+        service = SolverService(workers=1, cache_path=str(tmp_path / 'cache.sqlite'))
+        try:
+            first = await service.solve(dict(request))
+            second = await service.solve(dict(request))
+            return first, second, await service.stats()
+        finally:
+            service.close()
+    return asyncio.run(run())
+
+@pytest.mark.parametrize('request_', [
+    {'engine': 'astar'},
+    {'engine': 'sa', 'seed': 1, 'max_evaluations': 2000},
+], ids=['deterministic', 'seeded'])
+def test_repeated_request_is_cached(tmp_path, request_):
+    first, second, stats = solve_twice(tmp_path, {'level': CORRIDOR, **request_})
+    assert first['status'] == 'solved' and not first['cached']
+    assert second['cached']
+    assert stats['cache']['size'] == 1
+
+# An unseeded SA or GA run is a new random run every time
+@pytest.mark.parametrize('engine', ['sa', 'ga'])
+def test_unseeded_stochastic_request_is_not_cached(tmp_path, engine):
+    first, second, stats = solve_twice(tmp_path, {'level': CORRIDOR, 'engine': engine, 'max_evaluations': 2000})
+    assert not first['cached'] and not second['cached']
+    assert stats['cache']['size'] == 0
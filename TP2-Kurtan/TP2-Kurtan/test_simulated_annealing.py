@@ -0,0 +1,76 @@
+import os
+import random
+
+import pytest
+
+from level import Level, iter_levels
+from search import astar
+from simulated_annealing import simulated_annealing, eval_func, get_random_neigh, get_random_push_neigh, is_optimum
+from tabuleiro import GameState
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.txt')
+
+def initial_states():
+    yield 'bundled', GameState()
+    for level in iter_levels(LEVELS):
+        yield level.name, level.initial_state()
+
+STATES = list(initial_states())
+
+def assert_zero_iff_optimum(state, heuristic):
+    assert (eval_func(state, heuristic) == 0) == is_optimum(state)
+
+# Seeded random walk through one of the SA neighbourhoods, back to the start
+# on a solved state or now and then at random
+def walk(initial, neighbour, steps=3000):
+    rng = random.Random(0)
+    random.seed(1)
+    state = initial
+    for _ in range(steps):
+        if is_optimum(state) or rng.random() < 0.01:
+            state = initial
+        state = neighbour(state)
+        yield state
+
+# SA stops on is_optimum and never leaves a state of cost 0, so the two have
+# to agree on every state the neighbourhoods reach
+@pytest.mark.parametrize('heuristic', ['manhattan', 'assignment'])
+@pytest.mark.parametrize('name, initial', STATES, ids=[name for name, _ in STATES])
+def test_cost_is_zero_only_when_solved(name, initial, heuristic):
+    for neighbour in (get_random_neigh, get_random_push_neigh):
+        for state in walk(initial, neighbour):
+            assert_zero_iff_optimum(state, heuristic)
+
+    # random walks rarely finish a level, so follow a solution to the end too
+    state = initial.clone()
+    for move in astar(initial.clone()).moves:
+        assert_zero_iff_optimum(state, heuristic)
+        state.move(move)
+    assert eval_func(state, heuristic) == 0 and is_optimum(state)
+
+# Both neighbourhoods reveal the key after a pull that places the last box
+@pytest.mark.parametrize('neighbour', [get_random_neigh, get_random_push_neigh])
+def test_neighbours_reveal_the_key(neighbour):
+    for state in walk(GameState(), neighbour, 20000):
+        assert state.key_visible or not state.check_all_boxes_on_targets()
+
+def test_gate_stays_closed_with_a_box_off_target():
+    state = GameState()
+    for move in astar(GameState()).moves[:-1]:
+        state.move(move)
+    assert state.key_picked and state.check_all_boxes_on_targets()
+    # take a box off its target: the gate must not open until it is back
+    layout = state.layout
+    target = (layout.targets & -layout.targets).bit_length() - 1
+    free = next(i for i in layout.open_cells if not (state.boxes | layout.targets) >> i & 1 and i != state.player)
+    state.move_box(target, free)
+    assert state.move(astar(GameState()).moves[-1]) == (False, "Invalid movement.")
+    assert not state.game_over
+
+# A player with no legal move still uses up its iterations, so the schedule
+# ends instead of looping on the same state
+def test_schedule_ends_without_moves():
+    level = Level.parse(['#######', '#..$$@#', '#######'], 'shut in')
+    result = simulated_annealing(100, 1, 0.5, 10, data={'state': level.initial_state()})
+    assert result.stop == 'temperature'
+    assert result.NumEvaluations == 1
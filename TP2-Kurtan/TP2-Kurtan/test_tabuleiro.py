@@ -0,0 +1,46 @@
+import os
+import random
+
+import pytest
+
+from kurtan_utils import apply_pull, is_box_stuck, pull
+from level import iter_levels
+from reachability import reachable
+from tabuleiro import DIRECTIONS, GameState
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels.txt')
+
+def initial_states():
+    yield 'bundled', GameState()
+    for level in iter_levels(LEVELS):
+        yield level.name, level.initial_state()
+
+STATES = list(initial_states())
+
+def assert_incremental(state):
+    assert (state.box_distance, state.stuck_boxes) == state.heuristic_terms()
+    assert state.zhash == state.compute_hash()
+    if state.region >= 0:
+        assert state.region == min(reachable(state))
+
+# box_distance, stuck_boxes, zhash and the region cache are kept up to date
+# move by move; recompute them from scratch along a seeded random walk with
+# pushes, the unstick pull and plain pulls
+@pytest.mark.parametrize('name, initial', STATES, ids=[name for name, _ in STATES])
+def test_incremental_terms_match_recomputation(name, initial):
+    rng = random.Random(0)
+    state = initial.clone()
+    for _ in range(5000):
+        if state.game_over or rng.random() < 0.005:
+            state = initial.clone()
+        direction = rng.choice(DIRECTIONS)
+        if rng.random() < 0.1:
+            state = pull(state, direction) or state
+        else:
+            moved, _ = state.move(direction)
+            if moved and is_box_stuck(state, direction):
+                state = apply_pull(state, direction) or state
+        if rng.random() < 0.2:
+            state.region_cell()  # fill the region cache, so later moves have to keep it
+        assert_incremental(state)
+        assert_incremental(state.clone())
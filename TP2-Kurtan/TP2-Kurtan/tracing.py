@@ -0,0 +1,78 @@
+import json
+import sys
+from collections import Counter
+
+# Structured tracing for the solver inner loops. Call sites check the level
+# before building an event:
+#
+#     if tracing.level >= tracing.DEBUG:
+#         tracing.emit('move', direction=d, board=state.board)
+#
+# so with tracing off (the default) the only cost is that comparison. INFO
+# has one event per SA temperature, GA generation and IDA* iteration, DEBUG
+# adds every move, pull and stuck box. cli.py turns it on with --trace.
+OFF = 0
+INFO = 1
+DEBUG = 2
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+level = OFF
+sinks = []
+
+# Always on, read them with get_counters() after a run
+counters = Counter()
+
+class NullSink:
+    def write(self, event, fields):
+        pass
+
+    def close(self):
+        pass
+
+class StdoutSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, event, fields):
+        board = fields.get('board')
+        others = ', '.join(f'{k}={v}' for k, v in fields.items() if k != 'board')
+        print(f'[{event}] {others}', file=self.stream)
+        if board is not None:
+            for row in board:
+                print(' '.join(row), file=self.stream)
+            print(file=self.stream)
+
+    def close(self):
+        self.stream.flush()
+
+class JsonlSink:
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, event, fields):
+        if 'board' in fields:
+            fields = dict(fields, board=[''.join(row) for row in fields['board']])
+        self.file.write(json.dumps({'event': event, **fields}, ensure_ascii=False, default=str) + '\n')
+
+    def close(self):
+        self.file.close()
+
+def configure(new_level, *new_sinks):
+    global level
+    for sink in sinks:
+        sink.close()
+    sinks[:] = new_sinks or [StdoutSink()]
+    level = new_level
+
+def disable():
+    configure(OFF, NullSink())
+
+def emit(event, **fields):
+    for sink in sinks:
+        sink.write(event, fields)
+
+def get_counters():
+    return dict(counters)
+
+def reset_counters():
+    counters.clear()